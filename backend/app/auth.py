@@ -1,28 +1,57 @@
+import os
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from . import crud, models, schemas, utils
 from .database import get_db
+from .password_pool import password_pool
+from .user_cache import CachedUser, user_cache
 
 security = HTTPBearer()
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-):
-    credentials_exception = HTTPException(
+# Let read-only endpoints take the user straight from the signed token
+# claims. An admin flag revoked after login is then honoured by those
+# endpoints only once the token expires.
+TRUST_TOKEN_CLAIMS = os.getenv("AUTH_TRUST_TOKEN_CLAIMS", "false").lower() == "true"
+
+def credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+async def authenticate_user(db: Session, username: str, password: str):
+    """The user if the password matches, else None.
+
+    Hashing is awaited on the password pool; only the queries take a
+    threadpool worker.
+    """
+    user = await run_in_threadpool(crud.get_user_by_username, db, username)
+    if user is None or not await password_pool.verify(password, user.hashed_password):
+        return None
     
+    # Upgrade legacy SHA-256 and low-cost hashes now that we know the password
+    if utils.password_needs_rehash(user.hashed_password):
+        hashed_password = await password_pool.hash(password)
+        user = await run_in_threadpool(crud.set_password_hash, db, user, hashed_password)
+    return user
+
+def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+):
     token_data = utils.verify_token(credentials.credentials)
     if token_data is None:
-        raise credentials_exception
+        raise credentials_exception()
     
-    user = crud.get_user_by_username(db, username=token_data["username"])
+    user = user_cache.get(token_data["username"])
     if user is None:
-        raise credentials_exception
+        db_user = crud.get_user_by_username(db, username=token_data["username"])
+        if db_user is None:
+            raise credentials_exception()
+        user = user_cache.put(db_user)
     
     return user
 
@@ -35,3 +64,30 @@ def get_current_admin_user(
             detail="Not enough permissions"
         )
     return current_user
+
+def get_token_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+):
+    """Like get_current_user, for read-only endpoints.
+
+    With AUTH_TRUST_TOKEN_CLAIMS enabled the user is built from the token
+    alone. Tokens issued before user ids were added to the claims still
+    go through the cache.
+    """
+    if TRUST_TOKEN_CLAIMS:
+        token_data = utils.verify_token(credentials.credentials)
+        if token_data is None:
+            raise credentials_exception()
+        if token_data.get("user_id") is not None:
+            return CachedUser(
+                token_data["user_id"],
+                token_data["username"],
+                is_admin=token_data.get("is_admin", False)
+            )
+    return get_current_user(credentials, db)
+
+def get_token_admin_user(
+    current_user: models.User = Depends(get_token_user)
+):
+    return get_current_admin_user(current_user)
@@ -0,0 +1,100 @@
+"""
+Streaming exports of the catalog and the issue history.
+
+Rows are read through a server-side cursor in batches of EXPORT_BATCH_SIZE
+as plain column tuples, without building ORM objects or pydantic models,
+and written out in chunks as they arrive. Memory use does not depend on
+the size of the export, and the header goes out before the first query
+finishes.
+
+The books export uses the same columns as catalog_import, so an export can
+be fed straight back in.
+"""
+
+import csv
+import io
+import json
+import os
+from sqlalchemy import select
+from . import models
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+BOOK_COLUMNS = [
+    models.Book.id,
+    models.Book.isbn,
+    models.Book.title,
+    models.Book.author,
+    models.Book.description,
+    models.Book.genre,
+    models.Book.publication_year,
+    models.Book.available_copies,
+    models.Book.total_copies,
+    models.Book.created_at,
+    models.Book.updated_at,
+]
+
+ISSUE_COLUMNS = [
+    models.BookIssue.id,
+    models.BookIssue.user_id,
+    models.User.username,
+    models.BookIssue.book_id,
+    models.Book.isbn.label("book_isbn"),
+    models.Book.title.label("book_title"),
+    models.BookIssue.status,
+    models.BookIssue.issue_date,
+    models.BookIssue.due_date,
+    models.BookIssue.return_date,
+]
+
+
+def _serialize(value):
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+def _stream(db, statement, file_format, batch_size):
+    result = db.execute(statement.execution_options(yield_per=batch_size))
+    names = list(result.keys())
+
+    if file_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(names)
+        yield buffer.getvalue()
+        for rows in result.partitions():
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows([_serialize(value) for value in row] for row in rows)
+            yield buffer.getvalue()
+    elif file_format == "ndjson":
+        for rows in result.partitions():
+            yield "".join(
+                json.dumps(dict(zip(names, map(_serialize, row)))) + "\n" for row in rows
+            )
+    else:
+        raise ValueError(f"Unsupported format '{file_format}', expected one of {', '.join(MEDIA_TYPES)}")
+
+
+def export_books(db, file_format, batch_size=EXPORT_BATCH_SIZE):
+    """Yield the whole catalog as CSV or NDJSON text chunks, in id order."""
+    statement = select(*BOOK_COLUMNS).order_by(models.Book.id)
+    return _stream(db, statement, file_format, batch_size)
+
+
+def export_issues(db, file_format, status=None, user_id=None, book_id=None, batch_size=EXPORT_BATCH_SIZE):
+    """Yield the issue history, with reader and book, as CSV or NDJSON chunks."""
+    statement = (
+        select(*ISSUE_COLUMNS)
+        .join(models.User, models.User.id == models.BookIssue.user_id)
+        .join(models.Book, models.Book.id == models.BookIssue.book_id)
+        .order_by(models.BookIssue.id)
+    )
+    if status is not None:
+        statement = statement.where(models.BookIssue.status == status)
+    if user_id is not None:
+        statement = statement.where(models.BookIssue.user_id == user_id)
+    if book_id is not None:
+        statement = statement.where(models.BookIssue.book_id == book_id)
+    return _stream(db, statement, file_format, batch_size)
@@ -0,0 +1,208 @@
+"""
+Bulk catalog import from CSV or JSON Lines.
+
+Files are parsed one row at a time, so memory does not grow with the feed.
+Each row is validated against schemas.BookCreate, and valid rows are written
+in batches with a single executemany INSERT ... ON DUPLICATE KEY UPDATE (or
+ON CONFLICT on SQLite/PostgreSQL) keyed on the unique ISBN.
+
+For a book that already exists the feed replaces the metadata columns it
+carries and leaves the others alone; blank CSV cells count as not carried.
+When the feed has total_copies, available_copies moves by the same amount
+as the total, so copies that are currently issued stay accounted for.
+
+import_books() yields progress events as it goes, which the admin endpoint
+streams back as JSON lines and import_books.py prints.
+"""
+
+import csv
+import io
+import json
+import os
+import threading
+from pydantic import ValidationError
+from sqlalchemy import case, func
+from . import models, schemas
+from .database import SessionLocal
+from .search_index import book_index
+from .stats import library_stats
+from .vector_index import book_vectors
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+
+FORMATS = ("csv", "jsonl")
+
+# Feed columns that replace the stored values on update, when present
+UPDATE_COLUMNS = ["title", "author", "description", "genre", "publication_year", "total_copies"]
+
+STRING_LENGTHS = {
+    column.name: column.type.length
+    for column in models.Book.__table__.columns
+    if getattr(column.type, "length", None)
+}
+
+
+def detect_format(filename):
+    """Guess the feed format from a file name."""
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".jsonl", ".ndjson"):
+        return "jsonl"
+    raise ValueError(f"Cannot tell the format of '{filename}', pass csv or jsonl")
+
+
+def iter_records(binary_file, file_format):
+    """Yield (row_number, record) pairs, or (row_number, error message)."""
+    if file_format not in FORMATS:
+        raise ValueError(f"Unsupported format '{file_format}', expected one of {', '.join(FORMATS)}")
+    text = io.TextIOWrapper(binary_file, encoding="utf-8-sig", newline="")
+    try:
+        if file_format == "csv":
+            # Row 1 is the header
+            for row_number, row in enumerate(csv.DictReader(text), 2):
+                # Leave blank cells out, so the schema defaults apply
+                yield row_number, {key: value for key, value in row.items() if key and value}
+            return
+        for row_number, line in enumerate(text, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as error:
+                yield row_number, f"invalid JSON: {error}"
+                continue
+            if not isinstance(record, dict):
+                yield row_number, "expected a JSON object"
+                continue
+            yield row_number, record
+    except UnicodeDecodeError as error:
+        raise ValueError(f"File is not valid UTF-8: {error}")
+    finally:
+        # Leave the caller's file open
+        text.detach()
+
+
+def validate_record(record):
+    """Return (row values, None) for a valid record, or (None, error message)."""
+    try:
+        book = schemas.BookCreate.model_validate(record)
+    except ValidationError as error:
+        return None, "; ".join(
+            f"{'.'.join(str(part) for part in detail['loc'])}: {detail['msg']}"
+            for detail in error.errors()
+        )
+    if not book.isbn:
+        return None, "isbn: required for import"
+    values = book.model_dump()
+    # Catch what the database would reject, instead of failing the whole batch
+    for column, length in STRING_LENGTHS.items():
+        if values[column] is not None and len(values[column]) > length:
+            return None, f"{column}: longer than {length} characters"
+    return values, None
+
+
+def _upsert_statement(dialect_name, columns):
+    """An upsert that overwrites only the given UPDATE_COLUMNS of an existing row."""
+    table = models.Book.__table__
+    if dialect_name == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        statement = insert(table)
+        new = statement.inserted
+    elif dialect_name in ("sqlite", "postgresql"):
+        if dialect_name == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        statement = insert(table)
+        new = statement.excluded
+    else:
+        raise ValueError(f"Bulk import is not supported on {dialect_name}")
+
+    assignments = []
+    if "total_copies" in columns:
+        available = table.c.available_copies + new.total_copies - table.c.total_copies
+        # MySQL applies assignments in order, so available_copies must be
+        # computed before total_copies is overwritten
+        assignments.append(("available_copies", case((available < 0, 0), else_=available)))
+    assignments += [(column, new[column]) for column in UPDATE_COLUMNS if column in columns]
+    assignments.append(("updated_at", func.now()))
+
+    if dialect_name == "mysql":
+        return statement.on_duplicate_key_update(assignments)
+    return statement.on_conflict_do_update(index_elements=[table.c.isbn], set_=dict(assignments))
+
+
+def _write_batch(db, statements, rows):
+    """Upsert one batch. Returns (inserted, updated)."""
+    isbns = list(rows)
+    existing = db.query(func.count(models.Book.id)).filter(models.Book.isbn.in_(isbns)).scalar()
+
+    # One executemany per set of carried columns, as each needs its own UPDATE
+    groups = {}
+    for columns, values in rows.values():
+        groups.setdefault(columns, []).append(values)
+    dialect_name = db.get_bind().dialect.name
+    for columns, group in groups.items():
+        statement = statements.get(columns)
+        if statement is None:
+            statement = statements[columns] = _upsert_statement(dialect_name, columns)
+        db.execute(statement, group)
+    db.commit()
+    return len(isbns) - existing, existing
+
+
+def _rebuild_indexes():
+    db = SessionLocal()
+    try:
+        book_index.rebuild(db)
+        book_vectors.rebuild(db)
+    except Exception as error:
+        print(f"Rebuilding indexes after import failed: {error}")
+    finally:
+        db.close()
+
+
+def import_books(db, binary_file, file_format, batch_size=IMPORT_BATCH_SIZE, update_indexes=True):
+    """Import a feed, yielding progress events.
+
+    update_indexes keeps this process's search and vector indexes and
+    library stats in step; a standalone import has none worth updating.
+    The stats are reconciled after each batch. The indexes are rebuilt once,
+    on a background thread after the last batch, so re-embedding the catalog
+    does not hold up the import; searches see the new books when it is done.
+
+    Events are dicts with an "event" key:
+    - "error": a rejected row, with its row number and the reason
+    - "progress": running totals after each batch
+    - "done": the final totals
+    """
+    statements = {}  # carried columns -> upsert statement
+    totals = {"rows": 0, "inserted": 0, "updated": 0, "failed": 0}
+    batch = {}  # isbn -> (carried columns, row values); a later row for the same ISBN wins
+
+    def flush():
+        inserted, updated = _write_batch(db, statements, batch)
+        totals["inserted"] += inserted
+        totals["updated"] += updated
+        batch.clear()
+        if update_indexes:
+            library_stats.reconcile(db)
+        return {"event": "progress", **totals}
+
+    for row_number, record in iter_records(binary_file, file_format):
+        totals["rows"] += 1
+        values, error = (None, record) if isinstance(record, str) else validate_record(record)
+        if error:
+            totals["failed"] += 1
+            yield {"event": "error", "row": row_number, "error": error}
+            continue
+        batch[values["isbn"]] = (frozenset(record).intersection(UPDATE_COLUMNS), values)
+        if len(batch) >= batch_size:
+            yield flush()
+
+    if batch:
+        yield flush()
+    if update_indexes and totals["inserted"] + totals["updated"]:
+        threading.Thread(target=_rebuild_indexes, name="import-reindex", daemon=True).start()
+    yield {"event": "done", **totals}
@@ -0,0 +1,100 @@
+"""
+LRU cache of chat answers.
+
+Entries are keyed by the normalized question and the library statistics
+version, so any change to the catalog or to issue counts invalidates every
+cached answer. Entries also expire after a TTL.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from .metrics import register_collector
+
+CHAT_CACHE_MAX_ENTRIES = int(os.getenv("CHAT_CACHE_MAX_ENTRIES", "1024"))
+CHAT_CACHE_TTL_SECONDS = float(os.getenv("CHAT_CACHE_TTL_SECONDS", "600"))
+
+PUNCTUATION_PATTERN = re.compile(r"[^\w\s]")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_message(message: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    message = PUNCTUATION_PATTERN.sub(" ", message.lower())
+    return WHITESPACE_PATTERN.sub(" ", message).strip()
+
+
+class ChatCache:
+    def __init__(self, max_entries=CHAT_CACHE_MAX_ENTRIES, ttl=CHAT_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # normalized message -> (expires_at, response)
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+
+    def _check_version(self, version):
+        """False if version is older than the entries held."""
+        if self._version is None or version > self._version:
+            # Everything cached was answered against an older catalog
+            self._entries.clear()
+            self._version = version
+        return version == self._version
+
+    def get(self, message: str, version: int):
+        """Return the cached answer for message, or None."""
+        key = normalize_message(message)
+        with self._lock:
+            entry = self._entries.get(key) if self._check_version(version) else None
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, message: str, version: int, response: str):
+        key = normalize_message(message)
+        with self._lock:
+            # An answer built against an older catalog must not evict newer ones
+            if not self._check_version(version):
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+            }
+
+
+chat_cache = ChatCache()
+
+
+@register_collector
+def chat_cache_metrics():
+    stats = chat_cache.stats()
+    return [
+        ("smartlib_chat_cache_entries", "gauge", "Chat answers held in the cache.", stats["size"]),
+        ("smartlib_chat_cache_hits_total", "counter", "Chat questions answered from the cache.", stats["hits"]),
+        ("smartlib_chat_cache_misses_total", "counter", "Chat questions not found in the cache.", stats["misses"]),
+        ("smartlib_chat_cache_hit_ratio", "gauge", "Share of chat cache lookups that hit.", stats["hit_ratio"]),
+    ]
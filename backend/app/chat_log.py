@@ -0,0 +1,267 @@
+"""
+Write-behind persistence for chat history.
+
+/chat used to INSERT and commit every message before replying. Messages are
+now queued and written by a background thread in multi-row INSERTs, once
+CHAT_LOG_BATCH_SIZE messages are waiting or CHAT_LOG_FLUSH_SECONDS have
+passed, and whatever is left is flushed on shutdown.
+
+The reply still carries the message id. Ids come from blocks reserved in
+the id_sequences table with a conditional UPDATE, so several API processes
+can hand out ids without colliding, and are written explicitly with each
+row. Ids are unique but only increase within a process.
+
+The queue is bounded: when it is full, record() writes the message itself,
+so a stalled database slows chat down instead of growing memory.
+
+A batch the database rejects is written row by row and the rejected rows
+are dropped. A batch that fails because the database is unreachable is
+kept and retried, up to CHAT_LOG_MAX_RETRIES flushes, then dropped.
+"""
+
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import func, insert
+from sqlalchemy.exc import DatabaseError, IntegrityError, InterfaceError, OperationalError
+from . import models
+from .database import SessionLocal
+from .metrics import register_collector
+
+CHAT_LOG_BATCH_SIZE = int(os.getenv("CHAT_LOG_BATCH_SIZE", "200"))
+CHAT_LOG_FLUSH_SECONDS = float(os.getenv("CHAT_LOG_FLUSH_SECONDS", "1.0"))
+CHAT_LOG_QUEUE_SIZE = int(os.getenv("CHAT_LOG_QUEUE_SIZE", "10000"))
+CHAT_ID_BLOCK_SIZE = int(os.getenv("CHAT_ID_BLOCK_SIZE", "1000"))
+CHAT_LOG_MAX_RETRIES = int(os.getenv("CHAT_LOG_MAX_RETRIES", "30"))
+
+# Errors that mean the database could not be reached, not that the rows are bad
+TRANSIENT_ERRORS = (OperationalError, InterfaceError)
+
+
+class IdAllocator:
+    """Hands out ids from blocks reserved in the id_sequences table."""
+
+    def __init__(self, model, block_size=CHAT_ID_BLOCK_SIZE):
+        self.model = model
+        self.name = model.__tablename__
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._blocks = []  # reserved (next id, end) ranges, oldest first
+
+    def _reserve_block(self):
+        db = SessionLocal()
+        try:
+            while True:
+                next_value = db.query(models.IdSequence.next_value).filter(
+                    models.IdSequence.name == self.name
+                ).scalar()
+                if next_value is None:
+                    # First use: start above anything already in the table
+                    start = (db.query(func.max(self.model.id)).scalar() or 0) + 1
+                    db.add(models.IdSequence(name=self.name, next_value=start))
+                    try:
+                        db.commit()
+                    except IntegrityError:
+                        db.rollback()
+                    continue
+
+                reserved = db.query(models.IdSequence).filter(
+                    models.IdSequence.name == self.name,
+                    models.IdSequence.next_value == next_value
+                ).update(
+                    {models.IdSequence.next_value: next_value + self.block_size},
+                    synchronize_session=False
+                )
+                db.commit()
+                if reserved == 1:
+                    return [next_value, next_value + self.block_size]
+        finally:
+            db.close()
+
+    def refill(self):
+        """Reserve the next block once the current one is half used."""
+        with self._lock:
+            remaining = sum(end - start for start, end in self._blocks)
+        if remaining < self.block_size // 2 + 1:
+            block = self._reserve_block()
+            with self._lock:
+                self._blocks.append(block)
+
+    def next_id(self):
+        with self._lock:
+            while self._blocks and self._blocks[0][0] >= self._blocks[0][1]:
+                self._blocks.pop(0)
+            if self._blocks:
+                block = self._blocks[0]
+                block[0] += 1
+                return block[0] - 1
+        # Only reached before the writer thread has reserved a block
+        self.refill()
+        return self.next_id()
+
+
+class ChatLogWriter:
+    def __init__(
+        self,
+        batch_size=CHAT_LOG_BATCH_SIZE,
+        flush_interval=CHAT_LOG_FLUSH_SECONDS,
+        max_queue=CHAT_LOG_QUEUE_SIZE
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.ids = IdAllocator(models.ChatMessage)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._retry = []  # rows of a failed flush, written first next time
+        self._retry_attempts = 0
+        self.written = 0
+        self.batches = 0
+        self.direct_writes = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+
+    def record(self, user_id, message, response=None):
+        """Queue a chat message for writing and return its id."""
+        row = {
+            "id": self.ids.next_id(),
+            "user_id": user_id,
+            "message": message,
+            "response": response,
+            # Stamped now, not when the batch is written, so history keeps
+            # its order across a slow or failed flush
+            "created_at": datetime.utcnow(),
+        }
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.direct_writes += 1
+            self._write([row])
+        return row["id"]
+
+    def _write(self, rows):
+        db = SessionLocal()
+        try:
+            db.execute(insert(models.ChatMessage), rows)
+            db.commit()
+        finally:
+            db.close()
+
+    def _write_each(self, rows):
+        """Write rows one at a time, dropping the ones the database rejects.
+
+        Returns the rows written and, if the database became unreachable
+        part way through, the rows still to be written.
+        """
+        saved = []
+        for index, row in enumerate(rows):
+            try:
+                self._write([row])
+            except TRANSIENT_ERRORS:
+                return saved, rows[index:]
+            except DatabaseError as error:
+                self.dropped += 1
+                print(f"Dropped chat message {row['id']}: {error}")
+                continue
+            saved.append(row)
+        return saved, []
+
+    def _keep_for_retry(self, rows, error):
+        self.failed_flushes += 1
+        self._retry_attempts += 1
+        if self._retry_attempts > CHAT_LOG_MAX_RETRIES:
+            self.dropped += len(rows)
+            self._retry_attempts = 0
+            print(f"Dropped {len(rows)} chat messages after {CHAT_LOG_MAX_RETRIES} failed retries: {error}")
+        else:
+            self._retry = rows
+            print(f"Chat log flush of {len(rows)} messages failed: {error}")
+
+    def _drain(self, limit):
+        rows = self._retry
+        self._retry = []
+        while len(rows) < limit:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def flush(self):
+        """Write everything queued so far; returns the number of rows written."""
+        written = 0
+        while True:
+            rows = self._drain(self.batch_size)
+            if not rows:
+                return written
+            try:
+                self._write(rows)
+            except TRANSIENT_ERRORS as error:
+                # Keep the batch and try again on the next flush
+                self._keep_for_retry(rows, error)
+                return written
+            except DatabaseError:
+                # Retrying would fail the same way; save what can be saved
+                rows, unsent = self._write_each(rows)
+                if unsent:
+                    self._keep_for_retry(unsent, "database unreachable")
+                    written += len(rows)
+                    self.written += len(rows)
+                    return written
+            except Exception as error:
+                self._keep_for_retry(rows, error)
+                return written
+            self._retry_attempts = 0
+            written += len(rows)
+            self.written += len(rows)
+            self.batches += 1
+
+    def _loop(self):
+        last_flush = time.monotonic()
+        while not self._stop.is_set():
+            due = time.monotonic() - last_flush >= self.flush_interval
+            if due or self._queue.qsize() >= self.batch_size:
+                try:
+                    self.flush()
+                except Exception as error:
+                    print(f"Chat log flush failed: {error}")
+                last_flush = time.monotonic()
+            try:
+                self.ids.refill()
+            except Exception as error:
+                print(f"Could not reserve chat message ids: {error}")
+            self._stop.wait(min(self.flush_interval, 0.05))
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="chat-log", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the writer thread and flush what is still queued."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+    def pending(self):
+        return self._queue.qsize() + len(self._retry)
+
+
+chat_log = ChatLogWriter()
+
+
+@register_collector
+def chat_log_metrics():
+    return [
+        ("smartlib_chat_log_pending", "gauge", "Chat messages waiting to be written.", chat_log.pending()),
+        ("smartlib_chat_log_written_total", "counter", "Chat messages written by the background writer.", chat_log.written),
+        ("smartlib_chat_log_batches_total", "counter", "Multi-row chat message INSERTs.", chat_log.batches),
+        ("smartlib_chat_log_direct_writes_total", "counter", "Chat messages written inline because the queue was full.", chat_log.direct_writes),
+        ("smartlib_chat_log_failed_flushes_total", "counter", "Chat message batches that failed and were retried.", chat_log.failed_flushes),
+        ("smartlib_chat_log_dropped_total", "counter", "Chat messages the database rejected.", chat_log.dropped),
+    ]
@@ -1,7 +1,14 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import and_, func, insert, or_, select
 from . import models, schemas
-from .utils import get_password_hash, verify_password
+from .chat_log import chat_log
+from .database import record_write
+from .recommender import co_borrow
+from .search_index import book_index
+from .stats import book_values, library_stats
+from .vector_index import book_vectors
+from .user_cache import user_cache
 
 # User CRUD operations
 def get_user_by_username(db: Session, username: str):
@@ -13,8 +20,7 @@ def get_user_by_email(db: Session, email: str):
 def get_user(db: Session, user_id: int):
     return db.query(models.User).filter(models.User.id == user_id).first()
 
-def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = get_password_hash(user.password)
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: str):
     db_user = models.User(
         username=user.username,
         email=user.email,
@@ -23,28 +29,67 @@ def create_user(db: Session, user: schemas.UserCreate):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    user_cache.invalidate(db_user.username)
     return db_user
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = get_user_by_username(db, username)
-    if not user:
-        return False
-    if not verify_password(password, user.hashed_password):
-        return False
+def set_password_hash(db: Session, user: models.User, hashed_password: str):
+    user.hashed_password = hashed_password
+    db.commit()
+    db.refresh(user)
     return user
 
 # Book CRUD operations
-def get_books(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Book).offset(skip).limit(limit).all()
+def get_books(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    after_id: int = None,
+    available_only: bool = False,
+    genre: str = None,
+    author: str = None,
+    year: int = None,
+    columns=None
+):
+    # `columns` selects plain column tuples instead of Book objects
+    query = db.query(*columns) if columns else db.query(models.Book)
+    if available_only:
+        query = query.filter(models.Book.available_copies > 0)
+    if genre:
+        query = query.filter(models.Book.genre == genre)
+    if author:
+        # Prefix match, so the author index can be used
+        query = query.filter(models.Book.author.like(f"{_escape_like(author)}%", escape="\\"))
+    if year is not None:
+        query = query.filter(models.Book.publication_year == year)
+    
+    query = query.order_by(models.Book.id)
+    if after_id is not None:
+        return query.filter(models.Book.id > after_id).limit(limit).all()
+    return query.offset(skip).limit(limit).all()
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
 
 def get_book(db: Session, book_id: int):
     return db.query(models.Book).filter(models.Book.id == book_id).first()
 
+def get_books_by_ids(db: Session, book_ids, columns=None):
+    """Fetch books by primary key, keeping the order of book_ids."""
+    if not book_ids:
+        return []
+    query = db.query(*columns) if columns else db.query(models.Book)
+    books = query.filter(models.Book.id.in_(book_ids)).all()
+    books_by_id = {book.id: book for book in books}
+    return [books_by_id[book_id] for book_id in book_ids if book_id in books_by_id]
+
 def create_book(db: Session, book: schemas.BookCreate):
     db_book = models.Book(**book.dict())
     db.add(db_book)
     db.commit()
     db.refresh(db_book)
+    book_index.add_book(db_book)
+    book_vectors.add_book(db_book)
+    library_stats.add_book(book_values(db_book))
     return db_book
 
 def update_book(db: Session, book_id: int, book: schemas.BookUpdate):
@@ -52,12 +97,16 @@ def update_book(db: Session, book_id: int, book: schemas.BookUpdate):
     if not db_book:
         return None
     
+    old_values = book_values(db_book)
     update_data = book.dict(exclude_unset=True)
     for field, value in update_data.items():
         setattr(db_book, field, value)
     
     db.commit()
     db.refresh(db_book)
+    book_index.add_book(db_book)
+    book_vectors.add_book(db_book)
+    library_stats.update_book(old_values, book_values(db_book))
     return db_book
 
 def delete_book(db: Session, book_id: int):
@@ -65,11 +114,21 @@ def delete_book(db: Session, book_id: int):
     if not db_book:
         return False
     
+    old_values = book_values(db_book)
     db.delete(db_book)
     db.commit()
+    book_index.remove_book(book_id)
+    book_vectors.remove_book(book_id)
+    co_borrow.remove_book(book_id)
+    library_stats.remove_book(old_values)
     return True
 
-def search_books(db: Session, query: str, genre: str = None):
+def search_books(db: Session, query: str, genre: str = None, skip: int = 0, limit: int = 100, columns=None):
+    if book_index.ready:
+        book_ids = book_index.search(query, genre=genre, skip=skip, limit=limit)
+        return get_books_by_ids(db, book_ids, columns=columns)
+    
+    # The index is built at startup; until then fall back to a LIKE scan
     search_filter = or_(
         models.Book.title.contains(query),
         models.Book.author.contains(query),
@@ -79,14 +138,19 @@ def search_books(db: Session, query: str, genre: str = None):
     if genre:
         search_filter = search_filter & (models.Book.genre == genre)
     
-    return db.query(models.Book).filter(search_filter).all()
+    books = db.query(*columns) if columns else db.query(models.Book)
+    return books.filter(search_filter).offset(skip).limit(limit).all()
 
 # Chat CRUD operations
 def create_chat_message(db: Session, user_id: int, message: str, response: str = None):
+    # Ids come from the same blocks as chat_log, which writes them and the
+    # UTC created_at explicitly
     db_message = models.ChatMessage(
+        id=chat_log.ids.next_id(),
         user_id=user_id,
         message=message,
-        response=response
+        response=response,
+        created_at=datetime.utcnow()
     )
     db.add(db_message)
     db.commit()
@@ -94,10 +158,105 @@ def create_chat_message(db: Session, user_id: int, message: str, response: str =
     return db_message
 
 # Book Issue CRUD operations
+#
+# Copy counts are only ever changed with single conditional UPDATE
+# statements, so concurrent checkouts can neither oversell a book nor
+# return the same issue twice, without holding row locks across a
+# read-modify-write.
+
+def _claim_copy(db: Session, book_id: int) -> bool:
+    """Take one available copy of a book; False if none are left."""
+    claimed = db.query(models.Book).filter(
+        models.Book.id == book_id,
+        models.Book.available_copies > 0
+    ).update(
+        {models.Book.available_copies: models.Book.available_copies - 1},
+        synchronize_session=False
+    )
+    return claimed == 1
+
+def _release_copies(db: Session, book_id: int, count: int = 1) -> bool:
+    """Put copies of a book back on the shelf; False if the book is gone."""
+    released = db.query(models.Book).filter(models.Book.id == book_id).update(
+        {models.Book.available_copies: models.Book.available_copies + count},
+        synchronize_session=False
+    )
+    return released == 1
+
+def get_chat_history(db: Session, user_id: int, limit: int = 50, before=None, archived: bool = False):
+    """A user's chat messages, newest first.
+
+    before is the (created_at, id) of the last message on the previous page.
+    """
+    model = models.ChatMessageArchive if archived else models.ChatMessage
+    query = db.query(model).filter(model.user_id == user_id)
+    if before is not None:
+        created_at, message_id = before
+        query = query.filter(or_(
+            model.created_at < created_at,
+            and_(model.created_at == created_at, model.id < message_id)
+        ))
+    return query.order_by(model.created_at.desc(), model.id.desc()).limit(limit).all()
+
+def archive_chat_messages(db: Session, max_age: timedelta, batch_size: int = 1000):
+    """Move chat messages older than max_age into the archive table.
+
+    Each batch is copied with INSERT ... SELECT and deleted in the same
+    transaction. Returns the number of messages moved.
+    """
+    # created_at is stamped in UTC by the app (chat_log.record), like due
+    # and return dates, so measure age on the same clock
+    older_than = datetime.utcnow() - max_age
+    columns = ["id", "user_id", "message", "response", "created_at"]
+    moved = 0
+    while True:
+        message_ids = [message_id for message_id, in db.query(models.ChatMessage.id).filter(
+            models.ChatMessage.created_at < older_than
+        ).order_by(models.ChatMessage.created_at).limit(batch_size)]
+        if not message_ids:
+            return moved
+        
+        db.execute(
+            insert(models.ChatMessageArchive).from_select(
+                columns,
+                select(*(getattr(models.ChatMessage, column) for column in columns))
+                .where(models.ChatMessage.id.in_(message_ids))
+            )
+        )
+        db.query(models.ChatMessage).filter(
+            models.ChatMessage.id.in_(message_ids)
+        ).delete(synchronize_session=False)
+        db.commit()
+        moved += len(message_ids)
+        if len(message_ids) < batch_size:
+            return moved
+
+# Loans that still hold a copy; the sweeper moves "issued" to "overdue"
+OPEN_ISSUE_STATUSES = ("issued", "overdue")
+
+def _close_issue(db: Session, issue_id: int, user_id: int):
+    """Mark an issued or overdue book as returned; returns its book id, or None."""
+    db_issue = db.query(models.BookIssue.book_id).filter(
+        models.BookIssue.id == issue_id,
+        models.BookIssue.user_id == user_id,
+        models.BookIssue.status.in_(OPEN_ISSUE_STATUSES)
+    ).first()
+    if not db_issue:
+        return None
+    
+    # The status check makes a concurrent second return a no-op
+    closed = db.query(models.BookIssue).filter(
+        models.BookIssue.id == issue_id,
+        models.BookIssue.status.in_(OPEN_ISSUE_STATUSES)
+    ).update(
+        {models.BookIssue.status: "returned", models.BookIssue.return_date: datetime.utcnow()},
+        synchronize_session=False
+    )
+    return db_issue.book_id if closed == 1 else None
+
 def create_book_issue(db: Session, user_id: int, book_id: int, due_date):
-    # Check if book is available
-    book = get_book(db, book_id)
-    if not book or book.available_copies <= 0:
+    if not _claim_copy(db, book_id):
+        db.rollback()
         return None
     
     # Create the issue record
@@ -107,47 +266,178 @@ def create_book_issue(db: Session, user_id: int, book_id: int, due_date):
         due_date=due_date
     )
     db.add(db_issue)
-    
-    # Update book available copies
-    book.available_copies -= 1
-    
     db.commit()
     db.refresh(db_issue)
+    library_stats.copies_issued()
+    record_write(user_id)
+    co_borrow.record_issue(user_id, book_id)
     return db_issue
 
-def return_book(db: Session, issue_id: int, user_id: int):
-    # Get the issue record
-    db_issue = db.query(models.BookIssue).filter(
-        models.BookIssue.id == issue_id,
-        models.BookIssue.user_id == user_id,
-        models.BookIssue.status == "issued"
-    ).first()
+def create_book_issues(db: Session, user_id: int, book_ids, due_date):
+    """Issue several books in one transaction, all or nothing.
+
+    Returns (issues, unavailable_book_ids); nothing is issued unless the
+    second list is empty.
+    """
+    unavailable = [book_id for book_id in book_ids if not _claim_copy(db, book_id)]
+    if unavailable:
+        db.rollback()
+        return [], unavailable
     
-    if not db_issue:
+    db_issues = [
+        models.BookIssue(user_id=user_id, book_id=book_id, due_date=due_date)
+        for book_id in book_ids
+    ]
+    db.add_all(db_issues)
+    db.commit()
+    for db_issue in db_issues:
+        db.refresh(db_issue)
+        co_borrow.record_issue(user_id, db_issue.book_id)
+    library_stats.copies_issued(len(db_issues))
+    record_write(user_id)
+    return db_issues, []
+
+def return_book(db: Session, issue_id: int, user_id: int):
+    book_id = _close_issue(db, issue_id, user_id)
+    if book_id is None:
+        db.rollback()
         return None
     
-    # Update issue record
-    from datetime import datetime
-    db_issue.return_date = datetime.utcnow()
-    db_issue.status = "returned"
-    
-    # Update book available copies
-    book = get_book(db, db_issue.book_id)
-    if book:
-        book.available_copies += 1
+    released = _release_copies(db, book_id)
+    db.commit()
+    if released:
+        library_stats.copies_returned()
+        record_write(user_id)
+    return get_book_issue(db, issue_id)
+
+def return_books(db: Session, issue_ids, user_id: int):
+    """Return several issues in one transaction, all or nothing.
+
+    Returns (issues, missing_issue_ids); nothing is returned unless the
+    second list is empty.
+    """
+    returned_per_book = {}
+    missing = []
+    for issue_id in issue_ids:
+        book_id = _close_issue(db, issue_id, user_id)
+        if book_id is None:
+            missing.append(issue_id)
+        else:
+            returned_per_book[book_id] = returned_per_book.get(book_id, 0) + 1
+    if missing:
+        db.rollback()
+        return [], missing
     
+    released = sum(
+        count for book_id, count in returned_per_book.items()
+        if _release_copies(db, book_id, count)
+    )
     db.commit()
-    db.refresh(db_issue)
-    return db_issue
+    library_stats.copies_returned(released)
+    record_write(user_id)
+    issues = db.query(models.BookIssue).filter(models.BookIssue.id.in_(issue_ids)).all()
+    return issues, []
 
 def get_user_issued_books(db: Session, user_id: int):
-    return db.query(models.BookIssue).filter(
+    # The book comes back in the same SELECT
+    return db.query(models.BookIssue).options(joinedload(models.BookIssue.book)).filter(
         models.BookIssue.user_id == user_id,
-        models.BookIssue.status == "issued"
+        models.BookIssue.status.in_(OPEN_ISSUE_STATUSES)
     ).all()
 
-def get_all_book_issues(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.BookIssue).offset(skip).limit(limit).all()
+def mark_overdue_issues(db: Session, now: datetime = None, batch_size: int = 1000):
+    """Move loans past their due date from issued to overdue.
+
+    Works in batches of ids found through the (status, due_date) index, so
+    each UPDATE holds its row locks briefly. Returns the number marked.
+    """
+    now = now or datetime.utcnow()
+    marked = 0
+    while True:
+        issue_ids = [issue_id for issue_id, in db.query(models.BookIssue.id).filter(
+            models.BookIssue.status == "issued",
+            models.BookIssue.due_date < now
+        ).limit(batch_size)]
+        if not issue_ids:
+            return marked
+        
+        # A return that lands in between keeps its status
+        marked += db.query(models.BookIssue).filter(
+            models.BookIssue.id.in_(issue_ids),
+            models.BookIssue.status == "issued"
+        ).update({models.BookIssue.status: "overdue"}, synchronize_session=False)
+        db.commit()
+        if len(issue_ids) < batch_size:
+            return marked
+
+def get_open_issue_counts(db: Session):
+    """Number of issued and overdue loans.
+
+    Only the open statuses are counted, so this reads a range of the
+    (status, due_date) index rather than the whole returned history.
+    """
+    counts = dict.fromkeys(OPEN_ISSUE_STATUSES, 0)
+    counts.update(
+        db.query(models.BookIssue.status, func.count(models.BookIssue.id))
+        .filter(models.BookIssue.status.in_(OPEN_ISSUE_STATUSES))
+        .group_by(models.BookIssue.status)
+        .all()
+    )
+    return counts
+
+ISSUE_SORT_FIELDS = {
+    "id": models.BookIssue.id,
+    "due_date": models.BookIssue.due_date,
+    "issue_date": models.BookIssue.issue_date,
+    "status": models.BookIssue.status,
+}
+
+def get_all_book_issues(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    after_id: int = None,
+    status: str = None,
+    user_id: int = None,
+    book_id: int = None,
+    due_after: datetime = None,
+    due_before: datetime = None,
+    sort: str = "id",
+    descending: bool = False,
+    columns=None
+):
+    # User and book come back in the same SELECT, so a page is one query
+    if columns:
+        query = (
+            db.query(*columns)
+            .join(models.User, models.User.id == models.BookIssue.user_id)
+            .join(models.Book, models.Book.id == models.BookIssue.book_id)
+        )
+    else:
+        query = db.query(models.BookIssue).options(
+            joinedload(models.BookIssue.user),
+            joinedload(models.BookIssue.book)
+        )
+    if status is not None:
+        query = query.filter(models.BookIssue.status == status)
+    if user_id is not None:
+        query = query.filter(models.BookIssue.user_id == user_id)
+    if book_id is not None:
+        query = query.filter(models.BookIssue.book_id == book_id)
+    if due_after is not None:
+        query = query.filter(models.BookIssue.due_date >= due_after)
+    if due_before is not None:
+        query = query.filter(models.BookIssue.due_date < due_before)
+
+    column = ISSUE_SORT_FIELDS[sort]
+    if descending:
+        query = query.order_by(column.desc(), models.BookIssue.id.desc())
+    else:
+        query = query.order_by(column, models.BookIssue.id)
+
+    if after_id is not None:
+        return query.filter(models.BookIssue.id > after_id).limit(limit).all()
+    return query.offset(skip).limit(limit).all()
 
 def get_book_issue(db: Session, issue_id: int):
     return db.query(models.BookIssue).filter(models.BookIssue.id == issue_id).first()
\ No newline at end of file
@@ -1,9 +1,14 @@
 from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 import os
+import threading
+import time
 from urllib.parse import quote_plus
 from dotenv import load_dotenv
+from .metrics import register_collector
 
 load_dotenv()
 
@@ -15,10 +20,69 @@ MYSQL_DB = os.getenv("MYSQL_DB", "library_db")
 
 # URL encode the password to handle special characters like @
 ENCODED_PASSWORD = quote_plus(MYSQL_PASSWORD)
-DATABASE_URL = f"mysql+pymysql://{MYSQL_USER}:{ENCODED_PASSWORD}@{MYSQL_HOST}/{MYSQL_DB}"
+DATABASE_URL = os.getenv("DATABASE_URL") or f"mysql+pymysql://{MYSQL_USER}:{ENCODED_PASSWORD}@{MYSQL_HOST}/{MYSQL_DB}"
+
+# Optional read replica for read-only endpoints; a second SQLite file works
+# as a stand-in locally
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+
+# Connection pool settings
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Recycle connections before MySQL's wait_timeout closes them server-side
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+# How long a user's reads stay on the primary after they write, so they
+# see their own changes despite replica lag; catalog reads likewise stay on
+# the primary after any book change in this process
+READ_YOUR_WRITES_SECONDS = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "5"))
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+
+def make_engine(url):
+    options = {
+        "poolclass": TimedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if url.startswith("sqlite"):
+        options["connect_args"] = {"check_same_thread": False}
+    return create_engine(url, **options)
+
+
+engine = make_engine(DATABASE_URL)
+read_engine = make_engine(DATABASE_REPLICA_URL) if DATABASE_REPLICA_URL else engine
 
-engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 Base = declarative_base()
 
@@ -28,3 +92,67 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def get_read_db():
+    """Session on the read replica (the primary when none is configured)."""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Read-your-writes: user id -> when they last wrote, in this process
+_recent_writes = {}
+_recent_writes_lock = threading.Lock()
+
+def record_write(user_id: int):
+    now = time.monotonic()
+    with _recent_writes_lock:
+        _recent_writes[user_id] = now
+        # Forget users whose window has passed so the map stays small
+        if len(_recent_writes) > 10000:
+            for stale_id in [uid for uid, at in _recent_writes.items() if now - at > READ_YOUR_WRITES_SECONDS]:
+                del _recent_writes[stale_id]
+
+def wrote_recently(user_id: int) -> bool:
+    with _recent_writes_lock:
+        written_at = _recent_writes.get(user_id)
+    return written_at is not None and time.monotonic() - written_at < READ_YOUR_WRITES_SECONDS
+
+def pool_stats():
+    """Pool gauges for the primary and, if configured, the replica."""
+    engines = {"primary": engine}
+    if read_engine is not engine:
+        engines["replica"] = read_engine
+    stats = {}
+    for name, pool_engine in engines.items():
+        pool = pool_engine.pool
+        stats[name] = {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(pool.overflow(), 0),
+            "idle": pool.checkedin(),
+            "checkouts": getattr(pool, "checkouts", 0),
+            "wait_seconds": getattr(pool, "wait_seconds", 0.0),
+            "max_wait_seconds": getattr(pool, "max_wait_seconds", 0.0),
+            "timeouts": getattr(pool, "timeouts", 0),
+        }
+    return stats
+
+@register_collector
+def pool_metrics():
+    stats = pool_stats()
+
+    def per_pool(key):
+        return [({"pool": name}, values[key]) for name, values in stats.items()]
+
+    return [
+        ("smartlib_db_pool_size", "gauge", "Persistent connections the pool keeps.", per_pool("size")),
+        ("smartlib_db_pool_checked_out", "gauge", "Connections currently in use.", per_pool("checked_out")),
+        ("smartlib_db_pool_overflow", "gauge", "Connections open beyond the pool size.", per_pool("overflow")),
+        ("smartlib_db_pool_idle", "gauge", "Connections idle in the pool.", per_pool("idle")),
+        ("smartlib_db_pool_checkouts_total", "counter", "Connection checkouts.", per_pool("checkouts")),
+        ("smartlib_db_pool_wait_seconds_total", "counter", "Time spent waiting to check out a connection.", per_pool("wait_seconds")),
+        ("smartlib_db_pool_max_wait_seconds", "gauge", "Longest wait for a connection since startup.", per_pool("max_wait_seconds")),
+        ("smartlib_db_pool_timeouts_total", "counter", "Checkouts that gave up after DB_POOL_TIMEOUT.", per_pool("timeouts")),
+    ]
@@ -0,0 +1,119 @@
+"""
+Conditional GET for the catalog endpoints.
+
+Catalog responses carry a strong ETag derived from the catalog version
+(library_stats.version, bumped by every book and copy change this process
+commits) and a Last-Modified header with the time of that change. When a
+client revalidates with If-None-Match or If-Modified-Since and nothing has
+changed, the endpoint answers 304 Not Modified before touching the
+database, so neither the query nor the serialization runs.
+
+The tag also covers a per-process boot id, so two API processes never
+hand out the same tag for different data, and the last reconciliation,
+so changes made outside this process are picked up within one
+STATS_RECONCILE_SECONDS interval at the latest.
+
+Cache-Control is chosen per route; the defaults make clients revalidate
+on every use, which is what keeps a version-based tag correct.
+"""
+
+import hashlib
+import os
+import time
+import uuid
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import Response
+from .database import READ_YOUR_WRITES_SECONDS, engine, read_engine
+from .stats import library_stats
+
+BOOKS_CACHE_CONTROL = os.getenv("BOOKS_CACHE_CONTROL", "public, no-cache")
+BOOK_CACHE_CONTROL = os.getenv("BOOK_CACHE_CONTROL", "public, no-cache")
+
+BOOT_ID = uuid.uuid4().hex
+
+
+class Validators:
+    def __init__(self, etag, last_modified):
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def headers(self, cache_control=None):
+        headers = {
+            "ETag": self.etag,
+            "Last-Modified": format_datetime(self.last_modified, usegmt=True),
+        }
+        if cache_control:
+            headers["Cache-Control"] = cache_control
+        return headers
+
+
+def catalog_changed_recently():
+    """Whether this process changed the catalog within READ_YOUR_WRITES_SECONDS.
+
+    The replica may not have that change yet, so catalog reads go to the
+    primary meanwhile.
+    """
+    return time.monotonic() - library_stats.change_marker()[2] < READ_YOUR_WRITES_SECONDS
+
+
+def catalog_validators(db):
+    """ETag and Last-Modified for the current catalog version.
+
+    Returns None when db is the read replica and a change may not have
+    reached it yet: a response read from a lagging replica must not be
+    tagged with the new version, or clients would keep the stale copy.
+    """
+    version, changed_at, changed_monotonic, reconciled = library_stats.change_marker()
+
+    on_replica = read_engine is not engine and db.get_bind() is read_engine
+    if on_replica and time.monotonic() - changed_monotonic < READ_YOUR_WRITES_SECONDS:
+        return None
+
+    digest = hashlib.sha1(f"{BOOT_ID}:{version}:{reconciled}".encode()).hexdigest()
+    return Validators(f'"{digest[:20]}"', changed_at.replace(microsecond=0))
+
+
+def _etag_matches(header, etag):
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, so ignore W/ prefixes
+    tags = [tag.strip() for tag in header.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+def _not_modified_since(header, last_modified):
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return last_modified <= since
+
+
+def is_not_modified(request, validators):
+    """Whether the request's conditional headers match the validators."""
+    if validators is None:
+        return False
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-Modified-Since is ignored when If-None-Match is present
+        return _etag_matches(if_none_match, validators.etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        return _not_modified_since(if_modified_since, validators.last_modified)
+    return False
+
+
+def not_modified(validators, cache_control=None):
+    return Response(status_code=304, headers=validators.headers(cache_control))
+
+
+def set_validators(response, validators, cache_control=None):
+    """Add ETag, Last-Modified and Cache-Control to a full response."""
+    if validators is None:
+        # Nothing to revalidate against; do not let the copy be reused
+        response.headers["Cache-Control"] = "no-store"
+        return
+    response.headers.update(validators.headers(cache_control))
@@ -0,0 +1,237 @@
+"""
+Non-blocking client for the chat model.
+
+Generation is awaited on the event loop instead of pinning a threadpool
+worker, and every call is guarded by:
+- a per-request deadline
+- a global cap on concurrent generations
+- a circuit breaker that skips the backend entirely while it is failing
+
+When any of these trips, generate() returns None and the caller answers
+with the local fallback instead.
+"""
+
+import asyncio
+import os
+import time
+from typing import Optional
+from huggingface_hub import AsyncInferenceClient
+from .metrics import Counter, Histogram
+
+HF_MODEL = "mistralai/Mistral-7B-Instruct-v0.1"
+
+# Point at a self-hosted or stub text-generation server instead of the Hub
+INFERENCE_URL = os.getenv("INFERENCE_URL")
+
+INFERENCE_TIMEOUT_SECONDS = float(os.getenv("INFERENCE_TIMEOUT_SECONDS", "30"))
+INFERENCE_MAX_CONCURRENCY = int(os.getenv("INFERENCE_MAX_CONCURRENCY", "4"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("INFERENCE_CIRCUIT_FAILURES", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("INFERENCE_CIRCUIT_RESET_SECONDS", "30"))
+
+MAX_NEW_TOKENS = 800
+TEMPERATURE = 0.7
+
+# outcome is ok, error, timeout, cancelled (client went away), busy (no
+# free slot) or circuit_open
+INFERENCE_CALLS = Counter(
+    "smartlib_inference_calls_total", "Chat model calls by outcome.", ["mode", "outcome"]
+)
+INFERENCE_SECONDS = Histogram(
+    "smartlib_inference_duration_seconds", "Chat model call latency, from getting a slot to the last token.", ["mode", "outcome"]
+)
+
+
+class StreamInterrupted(Exception):
+    """The model failed after part of the reply had been streamed."""
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures and lets one trial call through
+    every reset_timeout seconds until a call succeeds again."""
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow_request(self):
+        state = self.state
+        if state == "half-open":
+            # Let this call through as the trial and hold everyone else back
+            self.opened_at = time.monotonic()
+            return True
+        return state == "closed"
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class ChatGenerator:
+    def __init__(
+        self,
+        client,
+        model=None,
+        timeout=INFERENCE_TIMEOUT_SECONDS,
+        max_concurrency=INFERENCE_MAX_CONCURRENCY,
+        breaker=None
+    ):
+        self.client = client
+        self.model = model
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.breaker = breaker or CircuitBreaker()
+        self._semaphore = None
+
+    @property
+    def semaphore(self):
+        # Created lazily so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def generate(self, prompt) -> Optional[str]:
+        """Generate a reply, or return None if the backend is unavailable."""
+        if not self.breaker.allow_request():
+            INFERENCE_CALLS.inc("generate", "circuit_open")
+            return None
+
+        # The deadline covers waiting for a slot as well as generation
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            # Saturated, not failing: don't count it against the backend
+            print("Inference busy: no free generation slot before the deadline")
+            INFERENCE_CALLS.inc("generate", "busy")
+            return None
+
+        started = time.perf_counter()
+        outcome = "cancelled"
+        try:
+            response = await asyncio.wait_for(
+                self.client.text_generation(
+                    prompt,
+                    model=self.model,
+                    max_new_tokens=MAX_NEW_TOKENS,
+                    temperature=TEMPERATURE,
+                    return_full_text=False
+                ),
+                timeout=max(deadline - loop.time(), 0)
+            )
+            outcome = "ok"
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            self.breaker.record_failure()
+            print(f"Inference timed out after {self.timeout}s")
+            return None
+        except Exception as error:
+            outcome = "error"
+            self.breaker.record_failure()
+            print(f"Hugging Face API error: {str(error)}")
+            return None
+        finally:
+            self.semaphore.release()
+            INFERENCE_CALLS.inc("generate", outcome)
+            INFERENCE_SECONDS.observe(time.perf_counter() - started, "generate", outcome)
+
+        self.breaker.record_success()
+        return response.strip()
+
+    async def stream(self, prompt):
+        """Yield reply tokens as the model produces them.
+
+        Yields nothing if the backend is unavailable or fails before the
+        first token, so the caller can switch to the fallback. A failure
+        after that raises StreamInterrupted once the partial reply is out,
+        so it is never mistaken for a complete one.
+        """
+        if not self.breaker.allow_request():
+            INFERENCE_CALLS.inc("stream", "circuit_open")
+            return
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            print("Inference busy: no free generation slot before the deadline")
+            INFERENCE_CALLS.inc("stream", "busy")
+            return
+
+        started = time.perf_counter()
+        outcome = "cancelled"
+        reason = None
+        streamed = False
+        try:
+            tokens = await asyncio.wait_for(
+                self.client.text_generation(
+                    prompt,
+                    model=self.model,
+                    max_new_tokens=MAX_NEW_TOKENS,
+                    temperature=TEMPERATURE,
+                    return_full_text=False,
+                    stream=True,
+                    details=True
+                ),
+                timeout=max(deadline - loop.time(), 0)
+            )
+            iterator = tokens.__aiter__()
+            while True:
+                try:
+                    token = await asyncio.wait_for(iterator.__anext__(), timeout=max(deadline - loop.time(), 0))
+                except StopAsyncIteration:
+                    break
+                # Leave out EOS and other special tokens, as generate() does
+                if token.token.special:
+                    continue
+                streamed = True
+                yield token.token.text
+            outcome = "ok"
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            reason = f"timed out after {self.timeout}s"
+            self.breaker.record_failure()
+            print(f"Inference stream timed out after {self.timeout}s")
+        except Exception as error:
+            outcome = "error"
+            reason = str(error)
+            self.breaker.record_failure()
+            print(f"Hugging Face API error: {str(error)}")
+        finally:
+            self.semaphore.release()
+            INFERENCE_CALLS.inc("stream", outcome)
+            INFERENCE_SECONDS.observe(time.perf_counter() - started, "stream", outcome)
+
+        if outcome != "ok":
+            if streamed:
+                raise StreamInterrupted(reason)
+            return
+        self.breaker.record_success()
+
+    async def close(self):
+        await self.client.close()
+
+
+def create_chat_generator(token=None):
+    """Build the generator from configuration, or None if no backend is set up."""
+    if INFERENCE_URL:
+        return ChatGenerator(AsyncInferenceClient(model=INFERENCE_URL, token=token))
+    if token:
+        return ChatGenerator(AsyncInferenceClient(token=token), model=HF_MODEL)
+    return None
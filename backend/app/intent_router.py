@@ -0,0 +1,242 @@
+"""
+Intent routing for offline chat answers.
+
+When the model is unavailable the chat endpoint answers from library data
+alone. A message is matched against precompiled intent patterns in
+priority order and handed to the handler registered for that intent in
+HANDLERS. Book lookups go through the search callables passed in by the
+caller (backed by the prebuilt search and vector indexes), so routing cost
+does not depend on catalog size and the module can be exercised on its own
+without a database.
+"""
+
+import re
+
+RECOMMENDATION_KEYWORDS = [
+    "recommend", "suggest", "want to read", "looking for",
+    "books about", "books on", "books in", "interested in",
+]
+
+# Patterns like "books about X", "books on X", "interested in X", in priority order
+TOPIC_PATTERNS = [
+    re.compile(rf"{re.escape(phrase)} (.+?)(?:\.|$|,|\?)")
+    for phrase in [
+        "books about", "books on", "books in", "interested in",
+        "looking for", "want to read", "recommend", "suggest",
+    ]
+]
+
+RECOMMENDATION_LIMIT = 10
+SEARCH_RESULT_LIMIT = 5
+SUMMARY_LIMIT = 10
+MIN_KEYWORD_LENGTH = 4
+
+
+def _any_of(phrases):
+    return re.compile("|".join(re.escape(phrase) for phrase in phrases))
+
+
+# (intent, patterns that must all match), checked in order
+INTENTS = [
+    ("recommend", [_any_of(RECOMMENDATION_KEYWORDS)]),
+    ("count", [_any_of(["how many books", "total books"])]),
+    ("available", [_any_of(["available"]), _any_of(["books", "copies"])]),
+    ("issued", [_any_of(["issued", "checked out", "borrowed"])]),
+    ("list", [_any_of(["all books", "list books", "books in library"])]),
+    ("summary", [_any_of(["summary", "summaries"])]),
+    ("genres", [_any_of(["genre"])]),
+]
+
+
+class RouterRequest:
+    """Everything a handler may need to answer one message."""
+
+    def __init__(self, message, chat_context, search_books, similar_books, model_configured=False):
+        self.message = message.lower()
+        self.context = chat_context
+        # search_books(query, genre=None) and similar_books(text) return
+        # lists of book summaries, best match first
+        self.search_books = search_books
+        self.similar_books = similar_books
+        self.model_configured = model_configured
+
+
+def detect_intent(message_lower):
+    for intent, patterns in INTENTS:
+        if all(pattern.search(message_lower) for pattern in patterns):
+            return intent
+    return "search"
+
+
+def extract_topic(message_lower, genres):
+    """Return (topic, genre) for a recommendation request.
+
+    A genre named in the message wins; otherwise the topic is taken from
+    phrases such as "books about X".
+    """
+    for genre in genres:
+        if genre.lower() in message_lower:
+            return genre, genre
+    for pattern in TOPIC_PATTERNS:
+        match = pattern.search(message_lower)
+        if match:
+            return match.group(1).strip(), None
+    return None, None
+
+
+def _recommend(request):
+    context = request.context
+    genres = context["genres"]
+    book_summaries = context["book_summaries"]
+    topic, genre_match = extract_topic(request.message, genres)
+
+    if topic:
+        if genre_match:
+            matching_books = request.search_books(topic, genre=genre_match)
+        else:
+            # Free-form topics go through the vector index, which also
+            # matches related word forms
+            matching_books = request.similar_books(topic)
+
+        if matching_books:
+            response = f"Based on your interest in '{topic}', here are some great book recommendations from our library:\n\n"
+            for i, book_info in enumerate(matching_books[:RECOMMENDATION_LIMIT], 1):
+                response += f"**{i}. {book_info['title']}** by {book_info['author']}\n"
+                response += f"   Genre: {book_info['genre']}\n"
+                response += f"   Description: {book_info['description']}\n"
+                response += f"   Availability: {book_info['available']} of {book_info['total']} copies available\n\n"
+            if len(matching_books) > RECOMMENDATION_LIMIT:
+                response += f"Plus {len(matching_books) - RECOMMENDATION_LIMIT} more books matching your interest!\n"
+            return response
+
+        # If no exact match, show some books from the library instead
+        response = f"I couldn't find exact matches for '{topic}', but here are some great books from our library:\n\n"
+        for i, book_info in enumerate(book_summaries[:5], 1):
+            response += f"**{i}. {book_info['title']}** by {book_info['author']}\n"
+            response += f"   Genre: {book_info['genre']}\n"
+            response += f"   Description: {book_info['description']}\n\n"
+        response += f"\nAvailable genres: {', '.join(genres.keys()) if genres else 'Various'}"
+        return response
+
+    # Generic recommendation - show books from different genres
+    response = "Here are some book recommendations from different genres in our library:\n\n"
+    shown_genres = set()
+    count = 0
+    for book_info in book_summaries:
+        if count >= 8:
+            break
+        if book_info['genre'] not in shown_genres or len(shown_genres) < 3:
+            shown_genres.add(book_info['genre'])
+            response += f"**{book_info['title']}** by {book_info['author']}\n"
+            response += f"   Genre: {book_info['genre']}\n"
+            response += f"   Description: {book_info['description']}\n"
+            response += f"   Availability: {book_info['available']} of {book_info['total']} copies available\n\n"
+            count += 1
+    response += f"\nYou can also ask for books in specific genres like: {', '.join(list(genres.keys())[:5]) if genres else 'Fiction, Science, History'}"
+    return response
+
+
+def _count(request):
+    context = request.context
+    response = "The library currently has:\n"
+    response += f"- {context['total_books']} unique book titles\n"
+    response += f"- {context['total_copies']} total book copies\n"
+    response += f"- {context['total_available_copies']} copies available for checkout\n"
+    response += f"- {context['total_issued']} copies currently issued/checked out\n"
+    if context["genres"]:
+        response += f"\nThe collection includes books from {len(context['genres'])} different genres: {context['genre_list']}."
+    return response
+
+
+def _available(request):
+    context = request.context
+    response = f"There are {context['total_available_copies']} book copies currently available in the library out of {context['total_copies']} total copies. "
+    response += f"This means {context['total_issued']} copies are currently issued/checked out."
+    return response
+
+
+def _issued(request):
+    context = request.context
+    response = f"Currently, {context['total_issued']} book copies are issued/checked out from the library. "
+    response += f"There are {context['total_available_copies']} copies still available for checkout out of {context['total_copies']} total copies."
+    return response
+
+
+def _list(request):
+    context = request.context
+    book_summaries = context["book_summaries"]
+    response = "Here are the books in our library:\n\n"
+    for i, book_info in enumerate(book_summaries, 1):
+        response += f"{i}. **{book_info['title']}** by {book_info['author']}\n"
+        response += f"   Genre: {book_info['genre']}\n"
+        response += f"   Description: {book_info['description']}\n"
+        response += f"   Availability: {book_info['available']} of {book_info['total']} copies available\n\n"
+    if context["total_books"] > len(book_summaries):
+        response += f"Plus {context['total_books'] - len(book_summaries)} more books in the collection."
+    return response
+
+
+def _summary(request):
+    context = request.context
+    response = "Here are summaries of books in our library:\n\n"
+    for book_info in context["book_summaries"][:SUMMARY_LIMIT]:
+        response += f"**{book_info['title']}** by {book_info['author']}: {book_info['description']}\n\n"
+    if context["total_books"] > SUMMARY_LIMIT:
+        response += f"Plus {context['total_books'] - SUMMARY_LIMIT} more books in the collection."
+    return response
+
+
+def _genres(request):
+    response = "The library has books in the following genres:\n"
+    for genre, count in request.context["genres"].items():
+        response += f"- {genre}: {count} books\n"
+    return response
+
+
+def _search(request):
+    # Try to find books matching any keywords in the message
+    context = request.context
+    keywords = [keyword for keyword in request.message.split() if len(keyword) >= MIN_KEYWORD_LENGTH]
+    matching_books = request.search_books(" ".join(keywords)) if keywords else []
+
+    if matching_books:
+        response = f"I found {len(matching_books)} book(s) that might interest you:\n\n"
+        for i, book_info in enumerate(matching_books[:SEARCH_RESULT_LIMIT], 1):
+            response += f"**{i}. {book_info['title']}** by {book_info['author']}\n"
+            response += f"   Genre: {book_info['genre']}\n"
+            response += f"   Description: {book_info['description']}\n\n"
+        return response
+
+    response = "I'm here to help you with library information! The library has:\n"
+    response += f"- {context['total_books']} unique book titles\n"
+    response += f"- {context['total_available_copies']} copies available for checkout\n"
+    response += f"- {context['total_issued']} copies currently issued\n\n"
+    response += "You can ask me about:\n"
+    response += "- How many books are in the library (shows available and issued counts)\n"
+    response += "- How many books are available\n"
+    response += "- How many books are issued/checked out\n"
+    response += "- List of all books\n"
+    response += "- Book summaries\n"
+    response += "- Available genres\n"
+    response += "- Book recommendations (e.g., 'recommend books about science', 'suggest fiction books')\n"
+    if request.model_configured:
+        response += "\nNote: AI service temporarily unavailable, but I can still help with library information!"
+    return response
+
+
+HANDLERS = {
+    "recommend": _recommend,
+    "count": _count,
+    "available": _available,
+    "issued": _issued,
+    "list": _list,
+    "summary": _summary,
+    "genres": _genres,
+    "search": _search,
+}
+
+
+def route(user_message, chat_context, search_books, similar_books, model_configured=False):
+    """Answer a chat message from library data alone."""
+    request = RouterRequest(user_message, chat_context, search_books, similar_books, model_configured)
+    return HANDLERS[detect_intent(request.message)](request)
@@ -1,20 +1,38 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, File, HTTPException, Query, Request, Response, UploadFile, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
-from huggingface_hub import InferenceClient
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
+from datetime import datetime, timedelta
+import json
 import os
-import re
 from dotenv import load_dotenv
 
-from . import crud, models, schemas, utils, auth
-from .database import SessionLocal, engine, get_db
+from . import crud, models, schemas, utils, auth, catalog_export, catalog_import, fast_json, http_cache, intent_router, metrics, retrieval, sql_profiler, sse
+from .chat_cache import chat_cache
+from .chat_log import chat_log
+from .database import SessionLocal, engine, get_db, get_read_db, wrote_recently
+from .inference import StreamInterrupted, create_chat_generator
+from .pagination import NEXT_CURSOR_HEADER, decode_cursor, decode_time_cursor, set_next_cursor, set_next_time_cursor
+from .password_pool import password_pool
+from .recommender import co_borrow
+from .request_metrics import RequestMetricsMiddleware
+from .scheduler import SCHEDULER_ENABLED, scheduler
+from .search_index import book_index
+from .stats import RECONCILE_INTERVAL_SECONDS, library_stats
+from .vector_index import VECTOR_INDEX_DIR, book_vectors
 
 load_dotenv()
 
 # Create database tables
 models.Base.metadata.create_all(bind=engine)
 
+# create_all leaves existing tables alone, so add indexes introduced since
+for model in (models.Book, models.BookIssue, models.ChatMessage):
+    for index in model.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+
 # Initialize FastAPI app
 app = FastAPI(title="SmartLib API", version="1.0.0")
 
@@ -25,39 +43,116 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag", "Last-Modified"],
 )
 
+# Outermost, so the latency covers the other middleware too
+app.add_middleware(RequestMetricsMiddleware)
+
 # Hugging Face configuration
 hf_api_key = os.getenv("HUGGINGFACEHUB_API_TOKEN")
-if hf_api_key:
-    hf_client = InferenceClient(token=hf_api_key)
-else:
-    hf_client = None
+chat_generator = create_chat_generator(token=hf_api_key)
+if chat_generator is None:
     print("Warning: HUGGINGFACEHUB_API_TOKEN not set. Chat will use fallback responses.")
 
-# Authentication endpoints
+@app.on_event("startup")
+def load_in_memory_state():
+    db = SessionLocal()
+    try:
+        book_index.rebuild(db)
+        library_stats.reconcile(db)
+        co_borrow.rebuild(db)
+        # Prefer the offline-built vectors; build them in-process otherwise
+        if VECTOR_INDEX_DIR and os.path.exists(os.path.join(VECTOR_INDEX_DIR, "vectors.npy")):
+            book_vectors.load(VECTOR_INDEX_DIR)
+            book_vectors.sync(db)
+        else:
+            book_vectors.rebuild(db)
+    finally:
+        db.close()
+
+# Maintenance jobs; with an interval of 0 a job only runs on demand, through
+# POST /admin/jobs/{job_name}/run
+OVERDUE_SWEEP_SECONDS = float(os.getenv("OVERDUE_SWEEP_SECONDS", "300"))
+OVERDUE_SWEEP_BATCH_SIZE = int(os.getenv("OVERDUE_SWEEP_BATCH_SIZE", "1000"))
+INDEX_REBUILD_SECONDS = float(os.getenv("INDEX_REBUILD_SECONDS", "0"))
+CHAT_ARCHIVE_SECONDS = float(os.getenv("CHAT_ARCHIVE_SECONDS", "3600"))
+CHAT_ARCHIVE_AFTER_DAYS = float(os.getenv("CHAT_ARCHIVE_AFTER_DAYS", "90"))
+
+def sweep_overdue(db: Session):
+    return {"marked": crud.mark_overdue_issues(db, batch_size=OVERDUE_SWEEP_BATCH_SIZE)}
+
+def reconcile_stats(db: Session):
+    library_stats.reconcile(db)
+    return {"version": library_stats.version}
+
+def archive_chat_history(db: Session):
+    max_age = timedelta(days=CHAT_ARCHIVE_AFTER_DAYS)
+    return {"archived": crud.archive_chat_messages(db, max_age=max_age)}
+
+def rebuild_indexes(db: Session):
+    # Picks up direct database edits and refreshes the vector IDF weights
+    book_index.rebuild(db)
+    book_vectors.rebuild(db)
+    co_borrow.rebuild(db)
+    return {"books": len(book_vectors)}
+
+scheduler.add_job("overdue_sweep", OVERDUE_SWEEP_SECONDS, sweep_overdue)
+scheduler.add_job("stats_reconcile", RECONCILE_INTERVAL_SECONDS, reconcile_stats)
+scheduler.add_job("index_rebuild", INDEX_REBUILD_SECONDS, rebuild_indexes)
+scheduler.add_job("chat_archive", CHAT_ARCHIVE_SECONDS, archive_chat_history)
+
+@app.on_event("startup")
+def start_scheduler():
+    if SCHEDULER_ENABLED:
+        scheduler.start()
+
+@app.on_event("shutdown")
+def stop_scheduler():
+    scheduler.stop()
+
+@app.on_event("startup")
+def start_chat_log():
+    chat_log.start()
+
+@app.on_event("shutdown")
+def flush_chat_log():
+    chat_log.stop()
+
+@app.on_event("shutdown")
+async def close_chat_generator():
+    if chat_generator:
+        await chat_generator.close()
+
+@app.on_event("shutdown")
+def stop_password_pool():
+    password_pool.shutdown()
+
+# Authentication endpoints. These are async so that requests waiting on the
+# password pool don't hold the threadpool workers other endpoints run on.
 @app.post("/auth/register", response_model=schemas.User)
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     # Check if user already exists
-    db_user = crud.get_user_by_username(db, username=user.username)
+    db_user = await run_in_threadpool(crud.get_user_by_username, db, username=user.username)
     if db_user:
         raise HTTPException(
             status_code=400,
             detail="Username already registered"
         )
     
-    db_user = crud.get_user_by_email(db, email=user.email)
+    db_user = await run_in_threadpool(crud.get_user_by_email, db, email=user.email)
     if db_user:
         raise HTTPException(
             status_code=400,
             detail="Email already registered"
         )
     
-    return crud.create_user(db=db, user=user)
+    hashed_password = await password_pool.hash(user.password)
+    return await run_in_threadpool(crud.create_user, db=db, user=user, hashed_password=hashed_password)
 
 @app.post("/auth/login", response_model=schemas.Token)
-def login(user_credentials: schemas.UserLogin, db: Session = Depends(get_db)):
-    user = crud.authenticate_user(db, user_credentials.username, user_credentials.password)
+async def login(user_credentials: schemas.UserLogin, db: Session = Depends(get_db)):
+    user = await auth.authenticate_user(db, user_credentials.username, user_credentials.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -66,7 +161,7 @@ def login(user_credentials: schemas.UserLogin, db: Session = Depends(get_db)):
         )
     
     access_token = utils.create_access_token(
-        data={"sub": user.username, "is_admin": user.is_admin}
+        data={"sub": user.username, "uid": user.id, "is_admin": user.is_admin}
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -74,28 +169,93 @@ def login(user_credentials: schemas.UserLogin, db: Session = Depends(get_db)):
 def read_users_me(current_user: models.User = Depends(auth.get_current_user)):
     return current_user
 
+@app.get("/users/me/recommendations", response_model=List[schemas.Book])
+def read_my_recommendations(
+    limit: int = 10,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_token_user)
+):
+    return crud.get_books_by_ids(db, co_borrow.recommend_for_user(current_user.id, limit=limit))
+
 # Book endpoints
+def get_catalog_read_db():
+    """Replica session, or the primary right after a book or copy change."""
+    yield from (get_db() if http_cache.catalog_changed_recently() else get_read_db())
+
 @app.get("/books", response_model=List[schemas.Book])
-def read_books(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    books = crud.get_books(db, skip=skip, limit=limit)
+def read_books(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    available_only: bool = False,
+    genre: Optional[str] = None,
+    author: Optional[str] = None,
+    year: Optional[int] = None,
+    db: Session = Depends(get_catalog_read_db)
+):
+    # `cursor` takes precedence over `skip`; the next page's cursor is
+    # returned in the X-Next-Cursor header. `author` matches a name prefix.
+    validators = http_cache.catalog_validators(db)
+    if http_cache.is_not_modified(request, validators):
+        return http_cache.not_modified(validators, http_cache.BOOKS_CACHE_CONTROL)
+    books = crud.get_books(
+        db,
+        skip=skip,
+        limit=limit,
+        after_id=decode_cursor(cursor),
+        available_only=available_only,
+        genre=genre,
+        author=author,
+        year=year,
+        columns=fast_json.BOOK_COLUMNS if fast_json.FAST_JSON_RESPONSES else None
+    )
+    set_next_cursor(response, books, limit)
+    http_cache.set_validators(response, validators, http_cache.BOOKS_CACHE_CONTROL)
+    if fast_json.FAST_JSON_RESPONSES:
+        return fast_json.json_response(request, response, books)
     return books
 
 @app.get("/books/search", response_model=List[schemas.Book])
 def search_books(
+    request: Request,
+    response: Response,
     query: str,
     genre: str = None,
-    db: Session = Depends(get_db)
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_catalog_read_db)
 ):
-    books = crud.search_books(db, query=query, genre=genre)
+    columns = fast_json.BOOK_COLUMNS if fast_json.FAST_JSON_RESPONSES else None
+    books = crud.search_books(db, query=query, genre=genre, skip=skip, limit=limit, columns=columns)
+    if fast_json.FAST_JSON_RESPONSES:
+        return fast_json.json_response(request, response, books)
     return books
 
 @app.get("/books/{book_id}", response_model=schemas.Book)
-def read_book(book_id: int, db: Session = Depends(get_db)):
+def read_book(book_id: int, request: Request, response: Response, db: Session = Depends(get_catalog_read_db)):
+    validators = http_cache.catalog_validators(db)
+    if http_cache.is_not_modified(request, validators):
+        return http_cache.not_modified(validators, http_cache.BOOK_CACHE_CONTROL)
     book = crud.get_book(db, book_id=book_id)
     if book is None:
         raise HTTPException(status_code=404, detail="Book not found")
+    http_cache.set_validators(response, validators, http_cache.BOOK_CACHE_CONTROL)
     return book
 
+@app.get("/books/{book_id}/similar", response_model=List[schemas.Book])
+def read_similar_books(book_id: int, limit: int = 10, db: Session = Depends(get_db)):
+    if crud.get_book(db, book_id=book_id) is None:
+        raise HTTPException(status_code=404, detail="Book not found")
+    return crud.get_books_by_ids(db, book_vectors.similar_to_book(book_id, limit=limit))
+
+@app.get("/books/{book_id}/also-borrowed", response_model=List[schemas.Book])
+def read_also_borrowed_books(book_id: int, limit: int = 10, db: Session = Depends(get_db)):
+    if crud.get_book(db, book_id=book_id) is None:
+        raise HTTPException(status_code=404, detail="Book not found")
+    return crud.get_books_by_ids(db, co_borrow.also_borrowed(book_id, limit=limit))
+
 # Admin-only book endpoints
 @app.post("/admin/books", response_model=schemas.Book)
 def create_book(
@@ -105,6 +265,42 @@ def create_book(
 ):
     return crud.create_book(db=db, book=book)
 
+@app.post("/admin/books/import")
+def import_books(
+    file: UploadFile = File(...),
+    format: Optional[str] = None,
+    batch_size: int = catalog_import.IMPORT_BATCH_SIZE,
+    current_user: models.User = Depends(auth.get_current_admin_user)
+):
+    """Insert or update books from a CSV or JSONL upload, keyed on ISBN.
+
+    Progress is streamed back as JSON lines: an "error" line per rejected
+    row, a "progress" line per batch and a final "done" line with totals.
+    """
+    try:
+        file_format = format or catalog_import.detect_format(file.filename)
+        if file_format not in catalog_import.FORMATS:
+            raise ValueError(f"Unsupported format '{file_format}', expected csv or jsonl")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if batch_size < 1:
+        raise HTTPException(status_code=400, detail="batch_size must be positive")
+
+    def events():
+        # The import outlives the request's session, so it gets its own
+        db = SessionLocal()
+        try:
+            for event in catalog_import.import_books(db, file.file, file_format, batch_size=batch_size):
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            db.rollback()
+            print(f"Catalog import failed: {e}")
+            yield json.dumps({"event": "failed", "error": str(e)}) + "\n"
+        finally:
+            db.close()
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
 @app.put("/admin/books/{book_id}", response_model=schemas.Book)
 def update_book(
     book_id: int,
@@ -129,63 +325,54 @@ def delete_book(
     return {"message": "Book deleted successfully"}
 
 # Chat endpoint
-@app.post("/chat", response_model=schemas.ChatResponse)
-def chat_with_ai(
-    message: schemas.ChatMessage,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
-):
-    try:
-        # Fetch library information to provide context
-        all_books = crud.get_books(db, skip=0, limit=1000)
-        total_books = len(all_books)
-        
-        # Calculate total available and issued books
-        total_available_copies = sum(book.available_copies for book in all_books)
-        total_copies = sum(book.total_copies for book in all_books)
-        total_issued = total_copies - total_available_copies
-        
-        # Get all issued books from database (for verification)
-        from sqlalchemy import func
-        issued_books_count = db.query(func.count(models.BookIssue.id)).filter(
-            models.BookIssue.status == "issued"
-        ).scalar() or 0
-        # Use calculated total_issued for consistency
-        
-        # Get book statistics
-        genres = {}
-        book_summaries = []
-        for book in all_books:
-            if book.genre:
-                genres[book.genre] = genres.get(book.genre, 0) + 1
-            book_summaries.append({
-                "title": book.title,
-                "author": book.author,
-                "genre": book.genre or "Unknown",
-                "description": book.description or "No description available",
-                "available": book.available_copies,
-                "total": book.total_copies
-            })
-        
-        # Build library context
-        genre_list = ", ".join([f"{genre} ({count})" for genre, count in genres.items()])
-        library_context = f"""Library Information:
+CHAT_BOOK_SAMPLE_SIZE = 50
+CHAT_MATCH_LIMIT = 50
+CHAT_MIN_SIMILARITY = 0.1
+
+def summarize_book(book):
+    return {
+        "title": book.title,
+        "author": book.author,
+        "genre": book.genre or "Unknown",
+        "description": book.description or "No description available",
+        "available": book.available_copies,
+        "total": book.total_copies
+    }
+
+def build_chat_context(db: Session, user_message: str):
+    """Gather library statistics, sample books and the model prompt for a chat message."""
+    # Library-wide numbers come from the incrementally maintained stats,
+    # so they cost the same however large the catalog is
+    stats = library_stats.snapshot(db)
+    total_books = stats["total_titles"]
+    total_copies = stats["total_copies"]
+    total_available_copies = stats["available_copies"]
+    total_issued = stats["issued_copies"]
+    genres = stats["genres"]
+    
+    # A bounded sample of books for examples and listings
+    book_summaries = [summarize_book(book) for book in crud.get_books(db, skip=0, limit=CHAT_BOOK_SAMPLE_SIZE)]
+    
+    # Build library context
+    genre_list = ", ".join([f"{genre} ({count})" for genre, count in genres.items()])
+    library_context = f"""Library Information:
 - Total unique book titles: {total_books}
 - Total book copies: {total_copies}
 - Available copies: {total_available_copies}
 - Issued copies: {total_issued} (currently checked out)
 - Genres available: {genre_list if genre_list else 'Various genres'}
-- Books with details:
+- Books most relevant to the question, with details:
 """
-        # Add first 10 books as examples
-        for i, book_info in enumerate(book_summaries[:10], 1):
-            library_context += f"{i}. {book_info['title']} by {book_info['author']} ({book_info['genre']}) - {book_info['description'][:100]}...\n"
-        
-        if total_books > 10:
-            library_context += f"\n... and {total_books - 10} more books in the library.\n"
-        
-        # Enhanced system prompt with library context
-        system_prompt = f"""You are a helpful library assistant for SmartLib. You have access to the following library information:
+    # Only the books that best match the question go into the prompt
+    relevant_books = retrieval.retrieve_books(db, user_message)
+    context_lines = retrieval.build_book_context(relevant_books)
+    library_context += "".join(context_lines)
+    
+    if total_books > len(context_lines):
+        library_context += f"\n... and {total_books - len(context_lines)} more books in the library.\n"
+    
+    # Enhanced system prompt with library context
+    system_prompt = f"""You are a helpful library assistant for SmartLib. You have access to the following library information:
 
 {library_context}
 
@@ -204,190 +391,87 @@ IMPORTANT FOR RECOMMENDATIONS:
 - Always use actual books from the library information provided above
 
 Always provide accurate information based on the library data above. If asked about books, genres, or library statistics, use the information provided."""
+    
+    # Format prompt for Mistral instruction-tuned model
+    full_prompt = f"<s>[INST] {system_prompt}\n\nUser Question: {user_message}\n\nPlease provide a helpful response based on the library information provided. [/INST]"
+
+    return {
+        "total_books": total_books,
+        "total_copies": total_copies,
+        "total_available_copies": total_available_copies,
+        "total_issued": total_issued,
+        "genres": genres,
+        "genre_list": genre_list,
+        "book_summaries": book_summaries,
+        "prompt": full_prompt
+    }
+
+# source is cache, model, fallback or interrupted (the stream broke off);
+# fallback / total is the fallback rate
+CHAT_ANSWERS = metrics.Counter(
+    "smartlib_chat_answers_total", "Chat replies by where the answer came from.", ["endpoint", "source"]
+)
+
+def fallback_response(db: Session, user_message: str, chat_context: dict):
+    """Answer from library data alone, used when the model is unavailable."""
+    def search_books(query, genre=None):
+        books = crud.search_books(db, query=query, genre=genre, limit=CHAT_MATCH_LIMIT)
+        return [summarize_book(book) for book in books]
+    
+    def similar_books(text):
+        book_ids = book_vectors.search(text, limit=CHAT_MATCH_LIMIT, min_score=CHAT_MIN_SIMILARITY)
+        return [summarize_book(book) for book in crud.get_books_by_ids(db, book_ids)]
+    
+    return intent_router.route(
+        user_message,
+        chat_context,
+        search_books=search_books,
+        similar_books=similar_books,
+        model_configured=chat_generator is not None
+    )
+
+@app.post("/chat", response_model=schemas.ChatResponse)
+async def chat_with_ai(
+    message: schemas.ChatMessage,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    # Database work runs in the threadpool; only the model call is awaited
+    # on the event loop, so slow generations don't tie up worker threads
+    try:
+        # Repeated questions are answered from the cache while the catalog
+        # and issue counts are unchanged
+        catalog_version = library_stats.version
+        ai_response = chat_cache.get(message.message, catalog_version)
+        source = "cache"
         
-        # Format prompt for Mistral instruction-tuned model
-        full_prompt = f"<s>[INST] {system_prompt}\n\nUser Question: {message.message}\n\nPlease provide a helpful response based on the library information provided. [/INST]"
-        
-        # Call Hugging Face Inference API
-        ai_response = None
-        if hf_client:
-            try:
-                response = hf_client.text_generation(
-                    model="mistralai/Mistral-7B-Instruct-v0.1",
-                    prompt=full_prompt,
-                    max_new_tokens=800,
-                    temperature=0.7,
-                    return_full_text=False
-                )
-                ai_response = response.strip()
-            except Exception as hf_error:
-                print(f"Hugging Face API error: {str(hf_error)}")
-                # Will use fallback below
-        
-        # Use fallback if API call failed or client not available
-        if not ai_response:
-            # Fallback response if Hugging Face API fails
-            user_msg_lower = message.message.lower()
-            
-            # Check for book recommendation requests
-            recommendation_keywords = ["recommend", "suggest", "want to read", "looking for", "books about", "books on", "books in", "interested in"]
-            is_recommendation = any(keyword in user_msg_lower for keyword in recommendation_keywords)
+        if ai_response is None:
+            chat_context = await run_in_threadpool(build_chat_context, db, message.message)
             
-            if is_recommendation:
-                # Extract topic/domain from the message
-                topic = None
-                genre_match = None
-                
-                # Check if user mentioned a specific genre
-                for genre in genres.keys():
-                    if genre.lower() in user_msg_lower:
-                        genre_match = genre
-                        topic = genre
-                        break
-                
-                # If no genre match, try to extract topic from common patterns
-                if not topic:
-                    # Patterns like "books about X", "books on X", "interested in X"
-                    patterns = [
-                        r"books about (.+?)(?:\.|$|,|\?)",
-                        r"books on (.+?)(?:\.|$|,|\?)",
-                        r"books in (.+?)(?:\.|$|,|\?)",
-                        r"interested in (.+?)(?:\.|$|,|\?)",
-                        r"looking for (.+?)(?:\.|$|,|\?)",
-                        r"want to read (.+?)(?:\.|$|,|\?)",
-                        r"recommend (.+?)(?:\.|$|,|\?)",
-                        r"suggest (.+?)(?:\.|$|,|\?)",
-                    ]
-                    
-                    for pattern in patterns:
-                        match = re.search(pattern, user_msg_lower)
-                        if match:
-                            topic = match.group(1).strip()
-                            break
-                
-                # Search for matching books
-                if topic or genre_match:
-                    # Search books by genre, title, author, or description
-                    matching_books = []
-                    search_term = topic if topic else genre_match
-                    
-                    for book_info in book_summaries:
-                        book_text = f"{book_info['title']} {book_info['author']} {book_info['genre']} {book_info['description']}".lower()
-                        if search_term.lower() in book_text or (genre_match and book_info['genre'].lower() == genre_match.lower()):
-                            matching_books.append(book_info)
-                    
-                    if matching_books:
-                        ai_response = f"Based on your interest in '{search_term}', here are some great book recommendations from our library:\n\n"
-                        for i, book_info in enumerate(matching_books[:10], 1):
-                            ai_response += f"**{i}. {book_info['title']}** by {book_info['author']}\n"
-                            ai_response += f"   Genre: {book_info['genre']}\n"
-                            ai_response += f"   Description: {book_info['description']}\n"
-                            ai_response += f"   Availability: {book_info['available']} of {book_info['total']} copies available\n\n"
-                        
-                        if len(matching_books) > 10:
-                            ai_response += f"Plus {len(matching_books) - 10} more books matching your interest!\n"
-                    else:
-                        # If no exact match, show books from similar genres or all books
-                        ai_response = f"I couldn't find exact matches for '{search_term}', but here are some great books from our library:\n\n"
-                        for i, book_info in enumerate(book_summaries[:5], 1):
-                            ai_response += f"**{i}. {book_info['title']}** by {book_info['author']}\n"
-                            ai_response += f"   Genre: {book_info['genre']}\n"
-                            ai_response += f"   Description: {book_info['description']}\n\n"
-                        ai_response += f"\nAvailable genres: {', '.join(genres.keys()) if genres else 'Various'}"
-                else:
-                    # Generic recommendation - show books from different genres
-                    ai_response = "Here are some book recommendations from different genres in our library:\n\n"
-                    shown_genres = set()
-                    count = 0
-                    for book_info in book_summaries:
-                        if count >= 8:
-                            break
-                        if book_info['genre'] not in shown_genres or len(shown_genres) < 3:
-                            shown_genres.add(book_info['genre'])
-                            ai_response += f"**{book_info['title']}** by {book_info['author']}\n"
-                            ai_response += f"   Genre: {book_info['genre']}\n"
-                            ai_response += f"   Description: {book_info['description']}\n"
-                            ai_response += f"   Availability: {book_info['available']} of {book_info['total']} copies available\n\n"
-                            count += 1
-                    ai_response += f"\nYou can also ask for books in specific genres like: {', '.join(list(genres.keys())[:5]) if genres else 'Fiction, Science, History'}"
+            if chat_generator:
+                ai_response = await chat_generator.generate(chat_context["prompt"])
+            source = "model"
             
-            # Provide intelligent responses based on common queries
-            elif "how many books" in user_msg_lower or "total books" in user_msg_lower:
-                ai_response = f"The library currently has:\n"
-                ai_response += f"- {total_books} unique book titles\n"
-                ai_response += f"- {total_copies} total book copies\n"
-                ai_response += f"- {total_available_copies} copies available for checkout\n"
-                ai_response += f"- {total_issued} copies currently issued/checked out\n"
-                if genres:
-                    ai_response += f"\nThe collection includes books from {len(genres)} different genres: {genre_list}."
+            # Only cache fallback answers when there is no model to come back to
+            cacheable = bool(ai_response) or chat_generator is None
             
-            elif "available" in user_msg_lower and ("books" in user_msg_lower or "copies" in user_msg_lower):
-                ai_response = f"There are {total_available_copies} book copies currently available in the library out of {total_copies} total copies. "
-                ai_response += f"This means {total_issued} copies are currently issued/checked out."
+            # Use fallback if the model call failed or no client is configured
+            if not ai_response:
+                ai_response = await run_in_threadpool(fallback_response, db, message.message, chat_context)
+                source = "fallback"
             
-            elif "issued" in user_msg_lower or "checked out" in user_msg_lower or "borrowed" in user_msg_lower:
-                ai_response = f"Currently, {total_issued} book copies are issued/checked out from the library. "
-                ai_response += f"There are {total_available_copies} copies still available for checkout out of {total_copies} total copies."
-            elif "all books" in user_msg_lower or "list books" in user_msg_lower or "books in library" in user_msg_lower:
-                ai_response = f"Here are the books in our library:\n\n"
-                for i, book_info in enumerate(book_summaries, 1):
-                    ai_response += f"{i}. **{book_info['title']}** by {book_info['author']}\n"
-                    ai_response += f"   Genre: {book_info['genre']}\n"
-                    ai_response += f"   Description: {book_info['description']}\n"
-                    ai_response += f"   Availability: {book_info['available']} of {book_info['total']} copies available\n\n"
-            elif "summary" in user_msg_lower or "summaries" in user_msg_lower:
-                ai_response = "Here are summaries of books in our library:\n\n"
-                for book_info in book_summaries[:10]:
-                    ai_response += f"**{book_info['title']}** by {book_info['author']}: {book_info['description']}\n\n"
-                if total_books > 10:
-                    ai_response += f"Plus {total_books - 10} more books in the collection."
-            elif "genre" in user_msg_lower or "genres" in user_msg_lower:
-                ai_response = f"The library has books in the following genres:\n"
-                for genre, count in genres.items():
-                    ai_response += f"- {genre}: {count} books\n"
-            else:
-                # Try to find books matching any keywords in the message
-                keywords = user_msg_lower.split()
-                matching_books = []
-                
-                for book_info in book_summaries:
-                    book_text = f"{book_info['title']} {book_info['author']} {book_info['genre']} {book_info['description']}".lower()
-                    if any(keyword in book_text for keyword in keywords if len(keyword) > 3):
-                        matching_books.append(book_info)
-                
-                if matching_books:
-                    ai_response = f"I found {len(matching_books)} book(s) that might interest you:\n\n"
-                    for i, book_info in enumerate(matching_books[:5], 1):
-                        ai_response += f"**{i}. {book_info['title']}** by {book_info['author']}\n"
-                        ai_response += f"   Genre: {book_info['genre']}\n"
-                        ai_response += f"   Description: {book_info['description']}\n\n"
-                else:
-                    ai_response = f"I'm here to help you with library information! The library has:\n"
-                    ai_response += f"- {total_books} unique book titles\n"
-                    ai_response += f"- {total_available_copies} copies available for checkout\n"
-                    ai_response += f"- {total_issued} copies currently issued\n\n"
-                    ai_response += "You can ask me about:\n"
-                    ai_response += "- How many books are in the library (shows available and issued counts)\n"
-                    ai_response += "- How many books are available\n"
-                    ai_response += "- How many books are issued/checked out\n"
-                    ai_response += "- List of all books\n"
-                    ai_response += "- Book summaries\n"
-                    ai_response += "- Available genres\n"
-                    ai_response += "- Book recommendations (e.g., 'recommend books about science', 'suggest fiction books')\n"
-                    if hf_client:
-                        ai_response += f"\nNote: AI service temporarily unavailable, but I can still help with library information!"
+            if cacheable:
+                chat_cache.put(message.message, catalog_version, ai_response)
+        CHAT_ANSWERS.inc("chat", source)
         
-        # Save chat message to database
-        db_message = crud.create_chat_message(
-            db=db,
-            user_id=current_user.id,
-            message=message.message,
-            response=ai_response
+        # Queued for a batched write; the id is allocated up front
+        message_id = await run_in_threadpool(
+            chat_log.record, current_user.id, message.message, ai_response
         )
         
         return schemas.ChatResponse(
             response=ai_response,
-            message_id=db_message.id
+            message_id=message_id
         )
         
     except Exception as e:
@@ -399,7 +483,147 @@ Always provide accurate information based on the library data above. If asked ab
             detail=f"Error communicating with AI: {str(e)}"
         )
 
+def run_with_session(func, *args, **kwargs):
+    """Call func with a fresh session, for work that outlives the request's session."""
+    db = SessionLocal()
+    try:
+        return func(db, *args, **kwargs)
+    finally:
+        db.close()
+
+@app.post("/chat/stream")
+async def chat_with_ai_stream(
+    message: schemas.ChatMessage,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Stream the reply as Server-Sent Events.
+
+    Each `data:` event carries {"token": ...}; a final `done` event carries
+    {"message_id": ...} once the full reply has been queued for saving.
+    """
+    catalog_version = library_stats.version
+    cached_response = chat_cache.get(message.message, catalog_version)
+    chat_context = None
+    if cached_response is None:
+        chat_context = await run_in_threadpool(build_chat_context, db, message.message)
+    user_id = current_user.id
+
+    async def events():
+        parts = []
+        source = "cache" if cached_response is not None else "model"
+        try:
+            if cached_response is not None:
+                for chunk in sse.chunk_text(cached_response):
+                    parts.append(chunk)
+                    yield sse.format_event({"token": chunk})
+            elif chat_generator:
+                async for token in chat_generator.stream(chat_context["prompt"]):
+                    if not parts:
+                        token = token.lstrip()
+                        if not token:
+                            continue
+                    parts.append(token)
+                    yield sse.format_event({"token": token})
+            cacheable = cached_response is None and (parts or chat_generator is None)
+            
+            # Fall back if the model produced nothing, chunked the same way
+            if not parts:
+                source = "fallback"
+                ai_response = await run_in_threadpool(
+                    run_with_session, fallback_response, message.message, chat_context
+                )
+                for chunk in sse.chunk_text(ai_response):
+                    parts.append(chunk)
+                    yield sse.format_event({"token": chunk})
+            
+            ai_response = "".join(parts).strip()
+            CHAT_ANSWERS.inc("chat_stream", source)
+            if cacheable:
+                chat_cache.put(message.message, catalog_version, ai_response)
+            
+            message_id = await run_in_threadpool(
+                chat_log.record, user_id, message.message, ai_response
+            )
+            yield sse.format_event({"message_id": message_id}, event="done")
+        except StreamInterrupted as e:
+            # Not cached or saved: a cut-off reply is not an answer
+            CHAT_ANSWERS.inc("chat_stream", "interrupted")
+            yield sse.format_event({"detail": f"The reply was cut off: {e}"}, event="error")
+        except Exception as e:
+            import traceback
+            print(f"Chat stream error: {traceback.format_exc()}")
+            yield sse.format_event({"detail": f"Error communicating with AI: {str(e)}"}, event="error")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/chat/history", response_model=List[schemas.ChatHistoryEntry])
+def read_chat_history(
+    response: Response,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    archived: bool = False,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_token_user)
+):
+    """The current user's chat messages, newest first.
+
+    Follow X-Next-Cursor for older pages. Messages older than
+    CHAT_ARCHIVE_AFTER_DAYS are listed with archived=true. The last second
+    or so of messages may still be waiting in the write-behind queue.
+    """
+    messages = crud.get_chat_history(
+        db,
+        user_id=current_user.id,
+        limit=limit,
+        before=decode_time_cursor(cursor),
+        archived=archived
+    )
+    set_next_time_cursor(response, messages, limit)
+    return messages
+
+@app.get("/admin/chat-cache")
+def read_chat_cache_stats(current_user: models.User = Depends(auth.get_token_admin_user)):
+    return chat_cache.stats()
+
 # Book Issue endpoints
+@app.post("/books/issue/batch", response_model=List[schemas.BookIssue])
+def issue_books(
+    batch: schemas.BookIssueBatchCreate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    issues, unavailable = crud.create_book_issues(
+        db=db,
+        user_id=current_user.id,
+        book_ids=batch.book_ids,
+        due_date=batch.due_date
+    )
+    if unavailable:
+        raise HTTPException(
+            status_code=400,
+            detail={"message": "Books not available for issue", "book_ids": unavailable}
+        )
+    return issues
+
+@app.post("/books/return/batch")
+def return_books(
+    batch: schemas.BookReturnBatch,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    issues, missing = crud.return_books(db=db, issue_ids=batch.issue_ids, user_id=current_user.id)
+    if missing:
+        raise HTTPException(
+            status_code=404,
+            detail={"message": "Issues not found or already returned", "issue_ids": missing}
+        )
+    return {"message": f"{len(issues)} books returned successfully"}
+
 @app.post("/books/{book_id}/issue", response_model=schemas.BookIssue)
 def issue_book(
     book_id: int,
@@ -434,10 +658,14 @@ def return_book(
         )
     return {"message": "Book returned successfully"}
 
-@app.get("/my-books", response_model=List[schemas.BookIssue])
+def get_user_read_db(current_user: models.User = Depends(auth.get_token_user)):
+    """Replica session, or the primary right after this user issued or returned a book."""
+    yield from (get_db() if wrote_recently(current_user.id) else get_read_db())
+
+@app.get("/my-books", response_model=List[schemas.BookIssueWithBook])
 def get_my_issued_books(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    db: Session = Depends(get_user_read_db),
+    current_user: models.User = Depends(auth.get_token_user)
 ):
     issues = crud.get_user_issued_books(db=db, user_id=current_user.id)
     return issues
@@ -445,14 +673,132 @@ def get_my_issued_books(
 # Admin endpoints for book issues
 @app.get("/admin/book-issues", response_model=List[schemas.BookIssueWithDetails])
 def get_all_book_issues(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    issue_status: Optional[str] = Query(None, alias="status"),
+    user_id: Optional[int] = None,
+    book_id: Optional[int] = None,
+    due_after: Optional[datetime] = None,
+    due_before: Optional[datetime] = None,
+    sort: str = "id",
+    order: str = "asc",
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_admin_user)
+    current_user: models.User = Depends(auth.get_token_admin_user)
 ):
-    issues = crud.get_all_book_issues(db=db, skip=skip, limit=limit)
+    if sort not in crud.ISSUE_SORT_FIELDS or order not in ("asc", "desc"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"sort must be one of {', '.join(crud.ISSUE_SORT_FIELDS)} and order asc or desc"
+        )
+    # Cursors hold the last id, so they only work when paging in id order
+    if cursor and (sort, order) != ("id", "asc"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor pagination requires sort=id&order=asc"
+        )
+
+    issues = crud.get_all_book_issues(
+        db=db,
+        skip=skip,
+        limit=limit,
+        after_id=decode_cursor(cursor),
+        status=issue_status,
+        user_id=user_id,
+        book_id=book_id,
+        due_after=due_after,
+        due_before=due_before,
+        sort=sort,
+        descending=order == "desc",
+        columns=fast_json.ISSUE_DETAIL_COLUMNS if fast_json.FAST_JSON_RESPONSES else None
+    )
+    if (sort, order) == ("id", "asc"):
+        set_next_cursor(response, issues, limit)
+    if fast_json.FAST_JSON_RESPONSES:
+        return fast_json.json_response(request, response, issues)
     return issues
 
+# Admin exports
+def stream_export(export, file_format, filename, **filters):
+    if file_format not in catalog_export.MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+
+    def chunks():
+        # The export outlives the request's session, so it gets its own
+        db = SessionLocal()
+        try:
+            yield from export(db, file_format, **filters)
+        finally:
+            db.close()
+
+    return StreamingResponse(
+        chunks(),
+        media_type=catalog_export.MEDIA_TYPES[file_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{file_format}"'}
+    )
+
+@app.get("/admin/export/books")
+def export_books(
+    format: str = "csv",
+    current_user: models.User = Depends(auth.get_current_admin_user)
+):
+    return stream_export(catalog_export.export_books, format, "books")
+
+@app.get("/admin/export/issues")
+def export_issues(
+    format: str = "csv",
+    issue_status: Optional[str] = Query(None, alias="status"),
+    user_id: Optional[int] = None,
+    book_id: Optional[int] = None,
+    current_user: models.User = Depends(auth.get_current_admin_user)
+):
+    return stream_export(
+        catalog_export.export_issues, format, "book_issues",
+        status=issue_status, user_id=user_id, book_id=book_id
+    )
+
+# Admin maintenance endpoints
+@app.get("/admin/overdue")
+def read_overdue_summary(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_admin_user)
+):
+    """Open loan counts and the outcome of the last overdue sweep.
+
+    List the loans themselves with /admin/book-issues?status=overdue.
+    """
+    job = {job["name"]: job for job in scheduler.status()}.get("overdue_sweep")
+    return {**crud.get_open_issue_counts(db), "last_sweep": job}
+
+@app.get("/admin/jobs")
+def read_jobs(current_user: models.User = Depends(auth.get_token_admin_user)):
+    return scheduler.status()
+
+@app.post("/admin/jobs/{job_name}/run")
+def run_job(job_name: str, current_user: models.User = Depends(auth.get_current_admin_user)):
+    if job_name not in {job["name"] for job in scheduler.status()}:
+        raise HTTPException(status_code=404, detail="Job not found")
+    # Runs in this request's worker thread, alongside the scheduler thread
+    scheduler.run_job(job_name)
+    return {job["name"]: job for job in scheduler.status()}[job_name]
+
+@app.get("/admin/sql-profile")
+def read_sql_profile(
+    limit: int = 20,
+    order_by: str = "seconds",
+    current_user: models.User = Depends(auth.get_token_admin_user)
+):
+    """The statement fingerprints that have cost the most since startup."""
+    if order_by not in ("seconds", "count", "max_ms"):
+        raise HTTPException(status_code=400, detail="order_by must be seconds, count or max_ms")
+    return sql_profiler.profile(limit=limit, order_by=order_by)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    return metrics.render()
+
 # Health check endpoint
 @app.get("/")
 def read_root():
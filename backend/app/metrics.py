@@ -0,0 +1,137 @@
+"""
+Prometheus text-format metrics.
+
+Modules register collector functions that return metric families, and
+/metrics renders whatever the collectors report at scrape time. Values
+that are only known as events happen (request latencies, call counts) are
+recorded in a Counter or Histogram, which register themselves.
+"""
+
+import bisect
+import threading
+
+_collectors = []
+
+# Latency buckets in seconds, from a cache hit to a slow model call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def register_collector(collector):
+    """Register a function returning (name, type, help, value) tuples.
+
+    value is a number, or a list of (labels dict, number) pairs for a
+    labelled family. Histogram families use (labels dict, HistogramSample)
+    pairs instead.
+    """
+    _collectors.append(collector)
+    return collector
+
+
+class Counter:
+    """A monotonically increasing count per combination of label values."""
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+        register_collector(self.collect)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def collect(self):
+        with self._lock:
+            samples = [
+                (dict(zip(self.label_names, label_values)), value)
+                for label_values, value in self._values.items()
+            ]
+        return [(self.name, "counter", self.help_text, samples)]
+
+
+class HistogramSample:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    """Observations counted into fixed buckets per combination of label values."""
+
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._samples = {}
+        register_collector(self.collect)
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            sample = self._samples.get(label_values)
+            if sample is None:
+                sample = self._samples[label_values] = HistogramSample(self.buckets)
+            sample.counts[index] += 1
+            sample.sum += value
+            sample.count += 1
+
+    def collect(self):
+        with self._lock:
+            samples = []
+            for label_values, sample in self._samples.items():
+                copy = HistogramSample(self.buckets)
+                copy.counts = list(sample.counts)
+                copy.sum = sample.sum
+                copy.count = sample.count
+                samples.append((dict(zip(self.label_names, label_values)), copy))
+        return [(self.name, "histogram", self.help_text, samples)]
+
+
+def _format_bound(bound):
+    return str(int(bound)) if float(bound).is_integer() else str(bound)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _histogram_lines(name, labels, sample):
+    cumulative = 0
+    bounds = [_format_bound(bound) for bound in sample.buckets] + ["+Inf"]
+    for bound, count in zip(bounds, sample.counts):
+        cumulative += count
+        yield f"{name}_bucket{_labels({**labels, 'le': bound})} {cumulative}"
+    yield f"{name}_sum{_labels(labels)} {sample.sum}"
+    yield f"{name}_count{_labels(labels)} {sample.count}"
+
+
+def render():
+    """Render every registered metric family in Prometheus text format."""
+    lines = []
+    for collector in _collectors:
+        for name, metric_type, help_text, value in collector():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            samples = value if isinstance(value, list) else [({}, value)]
+            for labels, sample in samples:
+                if isinstance(sample, HistogramSample):
+                    lines.extend(_histogram_lines(name, labels, sample))
+                else:
+                    lines.append(f"{name}{_labels(labels)} {sample}")
+    return "\n".join(lines) + "\n"
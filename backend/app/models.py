@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, Boolean, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -22,7 +22,7 @@ class Book(Base):
     author = Column(String(100), nullable=False, index=True)
     isbn = Column(String(20), unique=True, index=True)
     description = Column(Text)
-    genre = Column(String(50))
+    genre = Column(String(50), index=True)
     publication_year = Column(Integer)
     available_copies = Column(Integer, default=1)
     total_copies = Column(Integer, default=1)
@@ -31,6 +31,11 @@ class Book(Base):
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        # Per-user history pages, and the archive job's age cutoff
+        Index("ix_chat_messages_user_id_created_at", "user_id", "created_at"),
+        Index("ix_chat_messages_created_at", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -40,8 +45,34 @@ class ChatMessage(Base):
     
     user = relationship("User")
 
+class ChatMessageArchive(Base):
+    """Chat messages moved out of chat_messages by the archive job."""
+    __tablename__ = "chat_messages_archive"
+    __table_args__ = (
+        Index("ix_chat_messages_archive_user_id_created_at", "user_id", "created_at"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    message = Column(Text, nullable=False)
+    response = Column(Text)
+    created_at = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class IdSequence(Base):
+    """Next unallocated id for tables whose ids are handed out in blocks."""
+    __tablename__ = "id_sequences"
+    
+    name = Column(String(50), primary_key=True)
+    next_value = Column(BigInteger, nullable=False)
+
 class BookIssue(Base):
     __tablename__ = "book_issues"
+    __table_args__ = (
+        # Admin filters on status/due date, and per-user open issues
+        Index("ix_book_issues_status_due_date", "status", "due_date"),
+        Index("ix_book_issues_user_id_status", "user_id", "status"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
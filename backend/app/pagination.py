@@ -0,0 +1,78 @@
+"""
+Keyset (cursor) pagination helpers.
+
+A cursor is an opaque, URL-safe token holding the id of the last row on the
+previous page, plus its timestamp for pages ordered newest first. The next
+page is read with ``id > last_id ORDER BY id``, which costs the same for
+every page, unlike OFFSET which walks and discards all skipped rows.
+"""
+
+import base64
+import json
+from datetime import datetime
+from fastapi import HTTPException, status
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _encode(payload: dict) -> str:
+    data = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def _decode(cursor: str) -> dict:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    payload = json.loads(base64.urlsafe_b64decode(padded))
+    if not isinstance(payload, dict) or not isinstance(payload.get("id"), int):
+        raise ValueError("cursor id must be an integer")
+    return payload
+
+
+def _invalid_cursor():
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Invalid pagination cursor"
+    )
+
+
+def encode_cursor(last_id: int) -> str:
+    """Encode the id of the last row on a page as an opaque cursor."""
+    return _encode({"id": last_id})
+
+
+def decode_cursor(cursor):
+    """Decode a cursor back to the last seen id; None means the first page."""
+    if not cursor:
+        return None
+    try:
+        return _decode(cursor)["id"]
+    except (ValueError, KeyError, TypeError):
+        raise _invalid_cursor()
+
+
+def encode_time_cursor(created_at: datetime, last_id: int) -> str:
+    """Encode the (created_at, id) of the last row on a newest-first page."""
+    return _encode({"at": created_at.isoformat(), "id": last_id})
+
+
+def decode_time_cursor(cursor):
+    """Decode a time cursor to (created_at, id); None means the first page."""
+    if not cursor:
+        return None
+    try:
+        payload = _decode(cursor)
+        return datetime.fromisoformat(payload["at"]), payload["id"]
+    except (ValueError, KeyError, TypeError):
+        raise _invalid_cursor()
+
+
+def set_next_cursor(response, rows, limit: int):
+    """Advertise the cursor for the following page when this page is full."""
+    if rows and len(rows) >= limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(rows[-1].id)
+
+
+def set_next_time_cursor(response, rows, limit: int):
+    """Like set_next_cursor, for pages ordered by (created_at, id)."""
+    if rows and len(rows) >= limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_time_cursor(rows[-1].created_at, rows[-1].id)
@@ -0,0 +1,100 @@
+"""
+Bounded process pool for password hashing.
+
+bcrypt is deliberately slow (~250ms of CPU per hash at 12 rounds). Running
+it in a small dedicated process pool keeps a login storm from starving the
+API's own workers of CPU. When more calls are queued than the pool can
+absorb, new ones are rejected straight away with 503 instead of piling up.
+
+hash() and verify() are awaited on the event loop, so callers waiting for
+a hash don't hold threadpool workers that /books and friends need. A call
+counts as in flight until its job has actually left the pool: a queued job
+is cancelled on timeout, a running one is counted until it finishes.
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException, status
+from . import utils
+from .metrics import register_collector
+
+PASSWORD_POOL_WORKERS = int(os.getenv("PASSWORD_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_POOL_QUEUE_DEPTH = int(os.getenv("PASSWORD_POOL_QUEUE_DEPTH", "32"))
+PASSWORD_POOL_TIMEOUT_SECONDS = float(os.getenv("PASSWORD_POOL_TIMEOUT_SECONDS", "10"))
+
+
+class PasswordPool:
+    def __init__(self, workers=PASSWORD_POOL_WORKERS, queue_depth=PASSWORD_POOL_QUEUE_DEPTH):
+        self.workers = workers
+        self.capacity = workers + queue_depth
+        self._lock = threading.Lock()
+        self._executor = None
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _busy(self):
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please try again shortly",
+            headers={"Retry-After": "1"},
+        )
+
+    def _finished(self, future):
+        with self._lock:
+            self.in_flight -= 1
+            if not future.cancelled() and future.exception() is None:
+                self.completed += 1
+
+    async def _run(self, func, *args):
+        with self._lock:
+            if self.in_flight >= self.capacity:
+                self.rejected += 1
+                raise self._busy()
+            if self._executor is None:
+                # Started lazily so importing the app doesn't spawn processes
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            self.in_flight += 1
+            future = self._executor.submit(func, *args)
+        future.add_done_callback(self._finished)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=PASSWORD_POOL_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            # Drops the job if it is still queued; a running one can't be stopped
+            future.cancel()
+            with self._lock:
+                self.rejected += 1
+            raise self._busy()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(utils.get_password_hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(utils.verify_password, password, hashed_password)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+password_pool = PasswordPool()
+
+
+@register_collector
+def password_pool_metrics():
+    with password_pool._lock:
+        in_flight = password_pool.in_flight
+        completed = password_pool.completed
+        rejected = password_pool.rejected
+    return [
+        ("smartlib_password_pool_workers", "gauge", "Processes in the password hashing pool.", password_pool.workers),
+        ("smartlib_password_pool_capacity", "gauge", "Maximum running plus queued password operations.", password_pool.capacity),
+        ("smartlib_password_pool_in_flight", "gauge", "Password operations running or queued.", in_flight),
+        ("smartlib_password_pool_utilization", "gauge", "In-flight password operations as a fraction of capacity.", in_flight / password_pool.capacity),
+        ("smartlib_password_pool_completed_total", "counter", "Password operations that finished successfully.", completed),
+        ("smartlib_password_pool_rejected_total", "counter", "Password operations shed with 503.", rejected),
+    ]
@@ -0,0 +1,147 @@
+"""
+"Readers also borrowed" recommendations from the book issue history.
+
+Keeps a sparse item-item co-occurrence matrix: two books co-occur once for
+every reader who borrowed both. New issues update it incrementally, and the
+top-N list for each book is cached and only recomputed after that book's
+row changes, so lookups at request time are dictionary reads.
+"""
+
+import heapq
+import math
+import os
+import threading
+from .staged_rebuild import StagedRebuild
+
+TOP_N = int(os.getenv("RECOMMENDER_TOP_N", "20"))
+
+# Only the most recent books of each reader are paired for co-occurrence.
+# This bounds the work per issue; the ids of older books are still kept so
+# that borrowing one again is not counted twice.
+MAX_USER_HISTORY = int(os.getenv("RECOMMENDER_MAX_USER_HISTORY", "200"))
+
+
+class CoBorrowModel(StagedRebuild):
+    _state = ("_cooccurrence", "_borrowers", "_user_books", "_seen", "_top", "_dirty")
+
+    def __init__(self, top_n=TOP_N, max_user_history=MAX_USER_HISTORY):
+        self.top_n = top_n
+        self.max_user_history = max_user_history
+        self._lock = threading.Lock()
+        self._init_rebuild()
+        self._reset()
+        self.ready = False
+
+    def _reset(self):
+        self._cooccurrence = {}  # book_id -> {other_book_id: shared readers}
+        self._borrowers = {}     # book_id -> number of distinct readers
+        self._user_books = {}    # user_id -> {book_id: None}, oldest first
+        self._seen = {}          # user_id -> every book_id counted for them
+        self._top = {}           # book_id -> [(book_id, score)], cached
+        self._dirty = set()
+
+    def _record(self, user_id, book_id):
+        # A reader counts once per book, even after it left their history
+        seen = self._seen.setdefault(user_id, set())
+        if book_id in seen:
+            return
+        seen.add(book_id)
+        history = self._user_books.setdefault(user_id, {})
+        self._borrowers[book_id] = self._borrowers.get(book_id, 0) + 1
+        row = self._cooccurrence.setdefault(book_id, {})
+        for other_id in history:
+            row[other_id] = row.get(other_id, 0) + 1
+            other_row = self._cooccurrence.setdefault(other_id, {})
+            other_row[book_id] = other_row.get(book_id, 0) + 1
+            self._dirty.add(other_id)
+        self._dirty.add(book_id)
+
+        history[book_id] = None
+        if len(history) > self.max_user_history:
+            del history[next(iter(history))]
+
+    def record_issue(self, user_id, book_id):
+        """Fold a single new issue into the model."""
+        with self._lock:
+            self._record(user_id, book_id)
+            self._log_change(("issue", user_id, book_id))
+
+    def _remove_book(self, book_id):
+        for other_id in self._cooccurrence.pop(book_id, {}):
+            self._cooccurrence.get(other_id, {}).pop(book_id, None)
+            self._dirty.add(other_id)
+        self._borrowers.pop(book_id, None)
+        self._top.pop(book_id, None)
+        for history in self._user_books.values():
+            history.pop(book_id, None)
+        for seen in self._seen.values():
+            seen.discard(book_id)
+
+    def remove_book(self, book_id):
+        """Forget a deleted book."""
+        with self._lock:
+            self._remove_book(book_id)
+            self._log_change(("remove", book_id))
+
+    def _replay(self, change):
+        # Issues the scan already saw are skipped by _record
+        if change[0] == "issue":
+            self._record(change[1], change[2])
+        else:
+            self._remove_book(change[1])
+
+    def rebuild(self, db, batch_size=10000):
+        """Rebuild the model from the book_issues table.
+
+        Issues are streamed in (user_id, id) order, so only the rows of one
+        batch are in memory besides the models themselves.
+        """
+        from . import models
+
+        def build():
+            staging = CoBorrowModel(self.top_n, self.max_user_history)
+            rows = (
+                db.query(models.BookIssue.user_id, models.BookIssue.book_id)
+                .order_by(models.BookIssue.user_id, models.BookIssue.id)
+                .yield_per(batch_size)
+            )
+            for user_id, book_id in rows:
+                staging._record(user_id, book_id)
+            return staging
+
+        self._staged_rebuild(build)
+
+    def _score(self, book_id, other_id, shared):
+        # Cosine similarity between the two books' reader sets
+        return shared / math.sqrt(self._borrowers.get(book_id, 1) * self._borrowers.get(other_id, 1))
+
+    def _top_for(self, book_id):
+        if book_id in self._dirty or book_id not in self._top:
+            row = self._cooccurrence.get(book_id, {})
+            self._top[book_id] = heapq.nlargest(
+                self.top_n,
+                ((other_id, self._score(book_id, other_id, shared)) for other_id, shared in row.items()),
+                key=lambda item: (item[1], -item[0])
+            )
+            self._dirty.discard(book_id)
+        return self._top[book_id]
+
+    def also_borrowed(self, book_id, limit=10):
+        """Ids of the books most often borrowed by readers of book_id."""
+        with self._lock:
+            return [other_id for other_id, _ in self._top_for(book_id)[:limit]]
+
+    def recommend_for_user(self, user_id, limit=10):
+        """Ids of books to suggest to a reader, from their borrowing history."""
+        with self._lock:
+            history = self._user_books.get(user_id, {})
+            scores = {}
+            for book_id in history:
+                for other_id, score in self._top_for(book_id):
+                    if other_id not in history:
+                        scores[other_id] = scores.get(other_id, 0) + score
+        ranked = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [book_id for book_id, _ in ranked]
+
+
+co_borrow = CoBorrowModel()
@@ -0,0 +1,139 @@
+"""
+Per-route request metrics.
+
+RequestMetricsMiddleware times every HTTP request and counts it under its
+route template (/books/{book_id}, not /books/42), so the number of series
+stays bounded. SQLAlchemy cursor events add up the queries each request
+runs and the time they take, and hand each statement to sql_profiler;
+the running totals live in a RequestStats object held in a context
+variable, which the threadpool that runs sync endpoints and dependencies
+inherits.
+
+The middleware is plain ASGI rather than BaseHTTPMiddleware, so streaming
+responses pass through untouched. For those the latency covers the whole
+stream.
+"""
+
+import contextvars
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from . import sql_profiler
+from .metrics import Counter, Histogram, register_collector
+
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+REQUESTS = Counter(
+    "smartlib_http_requests_total", "HTTP requests by route and status.", ["method", "route", "status"]
+)
+REQUEST_SECONDS = Histogram(
+    "smartlib_http_request_duration_seconds", "HTTP request latency.", ["method", "route"]
+)
+REQUEST_QUERIES = Histogram(
+    "smartlib_http_request_db_queries", "Database queries run per request.", ["route"], buckets=QUERY_COUNT_BUCKETS
+)
+REQUEST_DB_SECONDS = Histogram(
+    "smartlib_http_request_db_seconds", "Time per request spent in database queries.", ["route"]
+)
+DB_QUERIES = Counter("smartlib_db_queries_total", "Database queries, including background work.")
+DB_SECONDS = Counter("smartlib_db_query_seconds_total", "Time spent in database queries, including background work.")
+
+# Requests whose path matched no route share one label
+UNMATCHED_ROUTE = "unmatched"
+# Queries run outside any request (scheduler, chat log writer, startup)
+BACKGROUND_ROUTE = "background"
+
+
+class RequestStats:
+    __slots__ = ("scope", "queries", "db_seconds", "statements")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.statements = {}  # statement fingerprint -> times run
+
+
+current_request = contextvars.ContextVar("current_request", default=None)
+
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+
+def _add_in_flight(delta):
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight += delta
+
+
+@register_collector
+def in_flight_metrics():
+    return [("smartlib_http_requests_in_flight", "gauge", "HTTP requests being handled.", _in_flight)]
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    DB_QUERIES.inc()
+    DB_SECONDS.inc(amount=elapsed)
+    stats = current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+    route = route_label(stats.scope) if stats is not None else BACKGROUND_ROUTE
+    sql_profiler.record_query(stats, route, statement, parameters, elapsed)
+
+
+@event.listens_for(Engine, "handle_error")
+def _discard_query_timer(exception_context):
+    # after_cursor_execute does not fire for a failed statement
+    started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+def route_label(scope):
+    route = scope.get("route")
+    return route.path if route is not None else UNMATCHED_ROUTE
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = current_request.set(stats)
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        _add_in_flight(1)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            _add_in_flight(-1)
+            current_request.reset(token)
+            route = route_label(scope)
+            method = scope["method"]
+            REQUESTS.inc(method, route, str(status_code))
+            REQUEST_SECONDS.observe(elapsed, method, route)
+            REQUEST_QUERIES.observe(stats.queries, route)
+            REQUEST_DB_SECONDS.observe(stats.db_seconds, route)
+            sql_profiler.finish_request(stats, method, route)
@@ -0,0 +1,71 @@
+"""
+Retrieval of relevant catalog entries for the chat prompt.
+
+Instead of always sending the first few books to the model, the user's
+question is scored against the catalog and only the best matches are put
+into the prompt, trimmed to a fixed token budget.
+"""
+
+import os
+from . import crud
+from .search_index import book_index, tokenize
+
+CONTEXT_TOP_K = int(os.getenv("CHAT_CONTEXT_TOP_K", "10"))
+CONTEXT_MAX_TOKENS = int(os.getenv("CHAT_CONTEXT_MAX_TOKENS", "600"))
+DESCRIPTION_PREVIEW_CHARS = 100
+
+# Rough average for English text with the Mistral tokenizer
+CHARS_PER_TOKEN = 4
+
+# Words that say nothing about which books the user is after
+STOPWORDS = {
+    "a", "about", "an", "and", "any", "are", "book", "books", "can", "could",
+    "do", "does", "find", "for", "from", "give", "have", "how", "i", "in",
+    "is", "it", "library", "like", "looking", "many", "me", "my", "of", "on",
+    "or", "please", "read", "recommend", "show", "some", "suggest", "tell",
+    "that", "the", "there", "to", "want", "what", "which", "with", "would",
+    "you", "your",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate, good enough for budgeting prompt size."""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def index_scorer(question: str, limit: int):
+    """Default scorer: BM25 over the in-memory search index."""
+    terms = [token for token in tokenize(question) if token not in STOPWORDS]
+    if not terms:
+        return []
+    return book_index.search(" ".join(terms), limit=limit, prefix_last=False)
+
+
+def retrieve_books(db, question: str, top_k: int = CONTEXT_TOP_K, scorer=index_scorer):
+    """Return up to top_k books ranked by relevance to the question.
+
+    Falls back to the first books in the catalog when nothing matches, so
+    the model always sees a few concrete examples.
+    """
+    book_ids = scorer(question, top_k)
+    if book_ids:
+        return crud.get_books_by_ids(db, book_ids)
+    return crud.get_books(db, skip=0, limit=top_k)
+
+
+def build_book_context(books, max_tokens: int = CONTEXT_MAX_TOKENS):
+    """Format books as numbered prompt lines, stopping at the token budget.
+
+    Returns the list of lines that fit.
+    """
+    lines = []
+    used_tokens = 0
+    for i, book in enumerate(books, 1):
+        description = (book.description or "No description available")[:DESCRIPTION_PREVIEW_CHARS]
+        line = f"{i}. {book.title} by {book.author} ({book.genre or 'Unknown'}) - {description}...\n"
+        line_tokens = estimate_tokens(line)
+        if used_tokens + line_tokens > max_tokens:
+            break
+        lines.append(line)
+        used_tokens += line_tokens
+    return lines
@@ -0,0 +1,128 @@
+"""
+In-process scheduler for periodic maintenance jobs.
+
+Jobs are plain functions taking a database session. They are registered
+with add_job() and run one at a time on a single daemon thread, each with
+a fresh session, so a slow job delays the next one rather than piling up.
+Every run is timed and its outcome kept for /admin/jobs.
+
+With several API processes each runs its own scheduler, so jobs must be
+safe to run concurrently; the ones registered in main.py are.
+"""
+
+import os
+import threading
+import time
+import traceback
+from datetime import datetime
+from .database import SessionLocal
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+
+# How often the thread wakes up to look for due jobs
+TICK_SECONDS = 1.0
+
+
+class Job:
+    def __init__(self, name, interval, func):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.next_run = None
+        self._schedule()
+        self.runs = 0
+        self.failures = 0
+        self.last_run = None
+        self.last_duration = None
+        self.last_result = None
+        self.last_error = None
+
+    def _schedule(self):
+        # A disabled job stays registered so it can still be run on demand
+        if self.interval > 0:
+            self.next_run = time.monotonic() + self.interval
+
+    def is_due(self, now):
+        return self.next_run is not None and self.next_run <= now
+
+    def status(self):
+        return {
+            "name": self.name,
+            "enabled": self.interval > 0,
+            "interval_seconds": self.interval,
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_run": self.last_run,
+            "last_duration_seconds": self.last_duration,
+            "last_result": self.last_result,
+            "last_error": self.last_error,
+        }
+
+
+class Scheduler:
+    def __init__(self, tick=TICK_SECONDS):
+        self.tick = tick
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_job(self, name, interval, func):
+        """Run func(db) every interval seconds.
+
+        With a non-positive interval the job is never scheduled, but it is
+        listed and can still be started with run_job().
+        """
+        with self._lock:
+            self._jobs[name] = Job(name, interval, func)
+
+    def run_job(self, name):
+        """Run a job now, whatever its schedule, and return its result."""
+        job = self._jobs[name]
+        started = time.perf_counter()
+        db = SessionLocal()
+        try:
+            result = job.func(db)
+            job.last_result = result
+            job.last_error = None
+            return result
+        except Exception as error:
+            db.rollback()
+            job.failures += 1
+            job.last_error = str(error)
+            print(f"Scheduled job {name} failed: {traceback.format_exc()}")
+        finally:
+            db.close()
+            job.runs += 1
+            job.last_run = datetime.utcnow()
+            job.last_duration = time.perf_counter() - started
+            job._schedule()
+
+    def _loop(self):
+        while not self._stop.wait(self.tick):
+            with self._lock:
+                now = time.monotonic()
+                due = [job.name for job in self._jobs.values() if job.is_due(now)]
+            for name in due:
+                if self._stop.is_set():
+                    return
+                self.run_job(name)
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def status(self):
+        with self._lock:
+            return [job.status() for job in self._jobs.values()]
+
+
+scheduler = Scheduler()
@@ -73,10 +73,26 @@ class ChatResponse(BaseModel):
     response: str
     message_id: int
 
+class ChatHistoryEntry(BaseModel):
+    id: int
+    message: str
+    response: Optional[str] = None
+    created_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
 # Book Issue schemas
 class BookIssueCreate(BaseModel):
     due_date: datetime
 
+class BookIssueBatchCreate(BaseModel):
+    book_ids: List[int]
+    due_date: datetime
+
+class BookReturnBatch(BaseModel):
+    issue_ids: List[int]
+
 class BookIssue(BaseModel):
     id: int
     user_id: int
@@ -91,6 +107,9 @@ class BookIssue(BaseModel):
     class Config:
         from_attributes = True
 
+class BookIssueWithBook(BookIssue):
+    book: Book
+
 class BookIssueWithDetails(BaseModel):
     id: int
     user_id: int
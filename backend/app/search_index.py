@@ -0,0 +1,182 @@
+"""
+In-memory inverted index for book search.
+
+Books are tokenized over title, author, genre and description and ranked
+with BM25, so /books/search does not have to run leading-wildcard LIKE
+scans over the whole books table. The index is built once at startup and
+kept current by the book CRUD operations.
+"""
+
+import heapq
+import math
+import re
+import threading
+from bisect import bisect_left, insort
+from .staged_rebuild import StagedRebuild
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Matches in the title count more than matches in the description
+FIELD_WEIGHTS = {"title": 3, "author": 2, "genre": 2, "description": 1}
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Upper bound on how many vocabulary terms a partially typed word expands to
+MAX_PREFIX_EXPANSIONS = 50
+
+
+def tokenize(text):
+    """Split text into lowercase word tokens."""
+    if not text:
+        return []
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class SearchIndex(StagedRebuild):
+    _state = ("_postings", "_doc_terms", "_doc_lengths", "_doc_genres", "_total_length", "_vocabulary")
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._init_rebuild()
+        self._reset()
+        self.ready = False
+
+    def _reset(self):
+        self._postings = {}      # token -> {book_id: weighted term frequency}
+        self._doc_terms = {}     # book_id -> {token: weighted term frequency}
+        self._doc_lengths = {}   # book_id -> weighted document length
+        self._doc_genres = {}    # book_id -> genre
+        self._total_length = 0
+        self._vocabulary = []    # sorted tokens, used for prefix matching
+
+    def _document_terms(self, book):
+        terms = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(getattr(book, field, None)):
+                terms[token] = terms.get(token, 0) + weight
+        return terms
+
+    def _add(self, book_id, terms, genre):
+        self._doc_terms[book_id] = terms
+        self._doc_lengths[book_id] = sum(terms.values())
+        self._doc_genres[book_id] = genre
+        self._total_length += self._doc_lengths[book_id]
+        for token, frequency in terms.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                # None while a rebuild loads; it is sorted once at the end
+                if self._vocabulary is not None:
+                    insort(self._vocabulary, token)
+            postings[book_id] = frequency
+
+    def _remove(self, book_id):
+        terms = self._doc_terms.pop(book_id, None)
+        if terms is None:
+            return
+        self._total_length -= self._doc_lengths.pop(book_id)
+        self._doc_genres.pop(book_id, None)
+        for token in terms:
+            postings = self._postings[token]
+            postings.pop(book_id, None)
+            if not postings:
+                del self._postings[token]
+                if self._vocabulary is not None:
+                    del self._vocabulary[bisect_left(self._vocabulary, token)]
+
+    def _replay(self, change):
+        book_id, terms, genre = change
+        self._remove(book_id)
+        if terms is not None:
+            self._add(book_id, terms, genre)
+
+    def _apply(self, book_id, terms, genre):
+        self._replay((book_id, terms, genre))
+        self._log_change((book_id, terms, genre))
+
+    def add_book(self, book):
+        """Index a book, replacing any previous entry for the same id."""
+        terms = self._document_terms(book)
+        with self._lock:
+            self._apply(book.id, terms, book.genre)
+
+    def remove_book(self, book_id):
+        """Drop a book from the index."""
+        with self._lock:
+            self._apply(book_id, None, None)
+
+    def rebuild(self, db, batch_size=1000):
+        """Rebuild the whole index from the books table."""
+        from . import models
+
+        def build():
+            staging = SearchIndex()
+            staging._vocabulary = None
+            for book in db.query(models.Book).yield_per(batch_size):
+                staging._add(book.id, staging._document_terms(book), book.genre)
+            staging._vocabulary = sorted(staging._postings)
+            return staging
+
+        self._staged_rebuild(build)
+
+    def _expand_prefix(self, prefix):
+        start = bisect_left(self._vocabulary, prefix)
+        expansions = []
+        for token in self._vocabulary[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not token.startswith(prefix):
+                break
+            expansions.append(token)
+        return expansions
+
+    def search(self, query, genre=None, skip=0, limit=100, prefix_last=True):
+        """Return the ids of the best matching books, highest score first.
+
+        With prefix_last, the last word of the query is treated as a prefix
+        so that results stay useful while the user is still typing.
+        """
+        query_tokens = list(dict.fromkeys(tokenize(query)))
+        if not query_tokens or limit <= 0:
+            return []
+
+        with self._lock:
+            doc_count = len(self._doc_terms)
+            if doc_count == 0:
+                return []
+            average_length = self._total_length / doc_count
+
+            doc_lengths = self._doc_lengths
+            doc_genres = self._doc_genres
+            length_factor = K1 * B / average_length
+            base_norm = K1 * (1 - B)
+
+            scores = {}
+            for position, query_token in enumerate(query_tokens):
+                terms = [query_token]
+                if prefix_last and position == len(query_tokens) - 1:
+                    terms = self._expand_prefix(query_token) or terms
+
+                token_scores = {}
+                for term in terms:
+                    postings = self._postings.get(term)
+                    if not postings:
+                        continue
+                    idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                    weight = idf * (K1 + 1)
+                    for book_id, frequency in postings.items():
+                        if genre and doc_genres.get(book_id) != genre:
+                            continue
+                        score = weight * frequency / (frequency + base_norm + length_factor * doc_lengths[book_id])
+                        # A prefix counts once per document, via its best expansion
+                        if score > token_scores.get(book_id, 0):
+                            token_scores[book_id] = score
+
+                for book_id, score in token_scores.items():
+                    scores[book_id] = scores.get(book_id, 0) + score
+
+        ranked = heapq.nlargest(skip + limit, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [book_id for book_id, _ in ranked[skip:skip + limit]]
+
+
+book_index = SearchIndex()
@@ -0,0 +1,160 @@
+"""
+SQL profiling: slow-query log, N+1 detection and query budgets.
+
+Every statement is reduced to a fingerprint, its text with literals and
+IN lists replaced by "?", so the same query with different parameters
+counts as one. request_metrics feeds each executed statement in from its
+cursor events, together with the request it ran for:
+
+- statements slower than SQL_SLOW_QUERY_MS are printed with their
+  parameters and the route that ran them
+- a request that runs one fingerprint more than SQL_N_PLUS_ONE_THRESHOLD
+  times is reported as a likely N+1 (a lazy load or a query in a loop)
+- per-fingerprint totals are kept for /admin/sql-profile
+
+In tests, assert_max_queries() fails when the requests made inside it run
+more queries than its budget; background work (the scheduler, the chat
+log writer) does not count:
+
+    with assert_max_queries(2):
+        client.get("/admin/book-issues")
+"""
+
+import functools
+import os
+import re
+import threading
+from contextlib import contextmanager
+from .metrics import Counter
+
+SQL_PROFILING = os.getenv("SQL_PROFILING", "true").lower() == "true"
+SQL_SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "250"))
+SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "10"))
+
+# Bounds on what is kept and printed
+MAX_FINGERPRINTS = 1000
+MAX_PARAMETER_CHARS = 500
+
+SLOW_QUERIES = Counter("smartlib_db_slow_queries_total", "Queries slower than SQL_SLOW_QUERY_MS.", ["route"])
+N_PLUS_ONE_REQUESTS = Counter(
+    "smartlib_db_n_plus_one_requests_total", "Requests that repeated one statement past SQL_N_PLUS_ONE_THRESHOLD.", ["route"]
+)
+
+STRING_PATTERN = re.compile(r"'(?:[^']|'')*'")
+NUMBER_PATTERN = re.compile(r"\b\d+(?:\.\d+)?\b")
+PLACEHOLDER_LIST_PATTERN = re.compile(r"\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=4096)
+def fingerprint(statement):
+    """Normalize a statement so that only its shape is left."""
+    statement = STRING_PATTERN.sub("?", statement)
+    statement = NUMBER_PATTERN.sub("?", statement)
+    statement = PLACEHOLDER_LIST_PATTERN.sub("(?)", statement)
+    return WHITESPACE_PATTERN.sub(" ", statement).strip()
+
+
+class StatementStats:
+    __slots__ = ("count", "seconds", "max_seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+
+_totals = {}  # fingerprint -> StatementStats, across all requests
+_totals_lock = threading.Lock()
+
+# Statement lists of the active assert_max_queries() blocks, fed by requests only
+_captures = []
+
+
+def _format_parameters(parameters):
+    text = repr(parameters)
+    if len(text) > MAX_PARAMETER_CHARS:
+        text = text[:MAX_PARAMETER_CHARS] + "..."
+    return text
+
+
+def record_query(stats, route, statement, parameters, elapsed):
+    """Account for one executed statement; stats is None outside a request."""
+    if stats is not None:
+        for captured in _captures:
+            captured.append(statement)
+    if not SQL_PROFILING:
+        return
+
+    key = fingerprint(statement)
+    if stats is not None:
+        stats.statements[key] = stats.statements.get(key, 0) + 1
+
+    with _totals_lock:
+        totals = _totals.get(key)
+        if totals is None and len(_totals) < MAX_FINGERPRINTS:
+            totals = _totals[key] = StatementStats()
+        if totals is not None:
+            totals.count += 1
+            totals.seconds += elapsed
+            totals.max_seconds = max(totals.max_seconds, elapsed)
+
+    if elapsed * 1000 >= SQL_SLOW_QUERY_MS:
+        SLOW_QUERIES.inc(route)
+        print(
+            f"Slow query ({elapsed * 1000:.0f} ms) on {route}: {WHITESPACE_PATTERN.sub(' ', statement)} "
+            f"parameters={_format_parameters(parameters)}"
+        )
+
+
+def finish_request(stats, method, route):
+    """Report statements the request repeated past the N+1 threshold."""
+    if not SQL_PROFILING:
+        return
+    repeated = [(count, key) for key, count in stats.statements.items() if count > SQL_N_PLUS_ONE_THRESHOLD]
+    if repeated:
+        N_PLUS_ONE_REQUESTS.inc(route)
+        for count, key in sorted(repeated, reverse=True):
+            print(f"Possible N+1 on {method} {route}: ran {count} times: {key}")
+
+
+def profile(limit=20, order_by="seconds"):
+    """The most expensive fingerprints so far, by total time or count."""
+    with _totals_lock:
+        rows = [
+            {
+                "statement": key,
+                "count": totals.count,
+                "seconds": totals.seconds,
+                "mean_ms": totals.seconds / totals.count * 1000,
+                "max_ms": totals.max_seconds * 1000,
+            }
+            for key, totals in _totals.items()
+        ]
+    rows.sort(key=lambda row: row[order_by], reverse=True)
+    return rows[:limit]
+
+
+def reset():
+    with _totals_lock:
+        _totals.clear()
+
+
+@contextmanager
+def assert_max_queries(budget):
+    """Fail if requests handled during the block run more than budget statements."""
+    captured = []
+    _captures.append(captured)
+    try:
+        yield captured
+    finally:
+        _captures.remove(captured)
+    if len(captured) > budget:
+        counts = {}
+        for statement in captured:
+            key = fingerprint(statement)
+            counts[key] = counts.get(key, 0) + 1
+        listing = "\n".join(
+            f"  {count}x {key}" for key, count in sorted(counts.items(), key=lambda item: -item[1])
+        )
+        raise AssertionError(f"Ran {len(captured)} queries, budget is {budget}:\n{listing}")
@@ -0,0 +1,30 @@
+"""
+Helpers for Server-Sent Events responses.
+"""
+
+import json
+import re
+
+FALLBACK_CHUNK_CHARS = 40
+
+WORD_PATTERN = re.compile(r"\S+\s*|\s+")
+
+
+def format_event(data, event=None):
+    """Encode one SSE event with a JSON payload."""
+    message = ""
+    if event:
+        message += f"event: {event}\n"
+    return message + f"data: {json.dumps(data)}\n\n"
+
+
+def chunk_text(text, size=FALLBACK_CHUNK_CHARS):
+    """Split text into chunks of about size characters on word boundaries."""
+    chunk = ""
+    for word in WORD_PATTERN.findall(text):
+        chunk += word
+        if len(chunk) >= size:
+            yield chunk
+            chunk = ""
+    if chunk:
+        yield chunk
@@ -0,0 +1,50 @@
+"""
+Off-lock rebuilds for the in-memory indexes.
+
+A full rebuild scans a whole table, which is too long to hold the lock
+that searches and updates need. Instead the new state is built into a
+separate instance without the lock, while the live one keeps serving.
+Updates made meanwhile are logged; at the end the log is replayed onto
+the new state and its attributes are swapped in under the lock.
+"""
+
+import threading
+
+
+class StagedRebuild:
+    """Mixin for an index guarded by self._lock.
+
+    Subclasses list the attributes a rebuild replaces in _state, call
+    _log_change() under the lock for every update, and implement
+    _replay() to apply a logged change to a staging instance.
+    """
+
+    _state = ()
+
+    def _init_rebuild(self):
+        self._rebuild_lock = threading.Lock()
+        self._changes = None  # updates made while a rebuild scans
+
+    def _log_change(self, change):
+        if self._changes is not None:
+            self._changes.append(change)
+
+    def _replay(self, change):
+        raise NotImplementedError
+
+    def _staged_rebuild(self, build):
+        """Swap in the instance build() returns, once the logged changes are replayed onto it."""
+        with self._rebuild_lock:
+            with self._lock:
+                self._changes = []
+            try:
+                staging = build()
+                with self._lock:
+                    for change in self._changes:
+                        staging._replay(change)
+                    for name in self._state:
+                        setattr(self, name, getattr(staging, name))
+                    self.ready = True
+            finally:
+                with self._lock:
+                    self._changes = None
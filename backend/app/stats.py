@@ -0,0 +1,140 @@
+"""
+Incrementally maintained library statistics.
+
+The book and issue CRUD operations adjust the counters in O(1) as they
+commit, so readers such as the chat endpoint never have to load the
+catalog. The counters are periodically reconciled against the database to
+correct any drift (e.g. rows changed outside the API).
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from sqlalchemy import func
+
+RECONCILE_INTERVAL_SECONDS = int(os.getenv("STATS_RECONCILE_SECONDS", "300"))
+
+
+def book_values(book):
+    """The parts of a book that feed into the statistics."""
+    return (book.genre or None, book.total_copies or 0, book.available_copies or 0)
+
+
+class LibraryStats:
+    def __init__(self, reconcile_interval=RECONCILE_INTERVAL_SECONDS):
+        self._lock = threading.Lock()
+        self.reconcile_interval = reconcile_interval
+        self.total_titles = 0
+        self.total_copies = 0
+        self.available_copies = 0
+        self.genre_counts = {}
+        self.version = 0
+        self.changed_at = datetime.now(timezone.utc)
+        self.changed_monotonic = time.monotonic()
+        self.last_reconciled = None
+
+    def _changed(self):
+        self.version += 1
+        self.changed_at = datetime.now(timezone.utc)
+        self.changed_monotonic = time.monotonic()
+
+    def _apply(self, values, sign):
+        genre, total, available = values
+        self.total_titles += sign
+        self.total_copies += sign * total
+        self.available_copies += sign * available
+        if genre:
+            count = self.genre_counts.get(genre, 0) + sign
+            if count > 0:
+                self.genre_counts[genre] = count
+            else:
+                self.genre_counts.pop(genre, None)
+        self._changed()
+
+    def add_book(self, values):
+        with self._lock:
+            self._apply(values, 1)
+
+    def remove_book(self, values):
+        with self._lock:
+            self._apply(values, -1)
+
+    def update_book(self, old_values, new_values):
+        with self._lock:
+            self._apply(old_values, -1)
+            self._apply(new_values, 1)
+
+    def copies_issued(self, count=1):
+        with self._lock:
+            self.available_copies -= count
+            self._changed()
+
+    def copies_returned(self, count=1):
+        with self._lock:
+            self.available_copies += count
+            self._changed()
+
+    def reconcile(self, db):
+        """Recompute every counter from the database."""
+        from . import models
+
+        total_titles, total_copies, available_copies = db.query(
+            func.count(models.Book.id),
+            func.coalesce(func.sum(models.Book.total_copies), 0),
+            func.coalesce(func.sum(models.Book.available_copies), 0)
+        ).one()
+        genre_counts = dict(
+            db.query(models.Book.genre, func.count(models.Book.id))
+            .filter(models.Book.genre.isnot(None), models.Book.genre != "")
+            .group_by(models.Book.genre)
+            .all()
+        )
+
+        with self._lock:
+            # Only bump the version when something actually drifted, so that
+            # caches keyed on it survive a no-op reconciliation
+            changed = (
+                (self.total_titles, self.total_copies, self.available_copies, self.genre_counts)
+                != (total_titles, int(total_copies), int(available_copies), genre_counts)
+            )
+            self.total_titles = total_titles
+            self.total_copies = int(total_copies)
+            self.available_copies = int(available_copies)
+            self.genre_counts = genre_counts
+            if changed:
+                self._changed()
+            self.last_reconciled = time.monotonic()
+
+    def change_marker(self):
+        """(version, changed_at, changed_monotonic, last_reconciled) read together."""
+        with self._lock:
+            return self.version, self.changed_at, self.changed_monotonic, self.last_reconciled
+
+    def is_stale(self):
+        return (
+            self.last_reconciled is None
+            or time.monotonic() - self.last_reconciled > self.reconcile_interval
+        )
+
+    def snapshot(self, db=None):
+        """Return a consistent copy of the counters.
+
+        When a session is given and the last reconciliation is older than
+        the reconcile interval, the counters are refreshed first.
+        """
+        if db is not None and self.is_stale():
+            self.reconcile(db)
+
+        with self._lock:
+            return {
+                "total_titles": self.total_titles,
+                "total_copies": self.total_copies,
+                "available_copies": self.available_copies,
+                "issued_copies": self.total_copies - self.available_copies,
+                "genres": dict(self.genre_counts),
+                "version": self.version,
+            }
+
+
+library_stats = LibraryStats()
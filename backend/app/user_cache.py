@@ -0,0 +1,101 @@
+"""
+Per-process cache of authenticated users.
+
+get_current_user used to load the user row on every authenticated request.
+Users are now cached by username as detached snapshots of the columns the
+endpoints read, so a warm request costs a JWT verify plus a dictionary
+lookup. Entries expire after a TTL. Nothing in the app changes a user's
+admin flag, so a change made directly in the database is only picked up
+once the entry expires; the TTL bounds how stale a worker can be.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from .metrics import register_collector
+
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+
+
+class CachedUser:
+    """Read-only copy of a user row, safe to share between requests."""
+
+    __slots__ = ("id", "username", "email", "is_admin", "created_at")
+
+    def __init__(self, id, username, email=None, is_admin=False, created_at=None):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.is_admin = bool(is_admin)
+        self.created_at = created_at
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.username, user.email, user.is_admin, user.created_at)
+
+
+class UserCache:
+    def __init__(self, max_entries=USER_CACHE_MAX_ENTRIES, ttl=USER_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # username -> (expires_at, CachedUser)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, username):
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[username]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(username)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user):
+        """Cache a snapshot of a user row and return it."""
+        cached = CachedUser.from_user(user)
+        with self._lock:
+            self._entries[cached.username] = (time.monotonic() + self.ttl, cached)
+            self._entries.move_to_end(cached.username)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return cached
+
+    def invalidate(self, username):
+        with self._lock:
+            self._entries.pop(username, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+user_cache = UserCache()
+
+
+@register_collector
+def user_cache_metrics():
+    stats = user_cache.stats()
+    lookups = stats["hits"] + stats["misses"]
+    return [
+        ("smartlib_user_cache_entries", "gauge", "Users held in the authentication cache.", stats["entries"]),
+        ("smartlib_user_cache_hits_total", "counter", "Authenticated requests served without a user lookup.", stats["hits"]),
+        ("smartlib_user_cache_misses_total", "counter", "Authenticated requests that loaded the user from the database.", stats["misses"]),
+        ("smartlib_user_cache_hit_ratio", "gauge", "Share of user cache lookups that hit.", stats["hits"] / lookups if lookups else 0.0),
+    ]
@@ -3,34 +3,52 @@ from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 import hashlib
+import hmac
 import os
+import re
 from dotenv import load_dotenv
 
 load_dotenv()
 
 # Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__default_rounds=12)
+# Hashes below min_rounds are upgraded on the next successful login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=12,
+    bcrypt__min_rounds=12
+)
+
+# Passwords from before bcrypt was introduced are stored as bare SHA-256 hex digests
+LEGACY_SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
 
 # JWT settings
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "supersecretjwtkey")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+def is_legacy_hash(hashed_password: str) -> bool:
+    """Whether a stored hash is a legacy unsalted SHA-256 digest."""
+    return bool(LEGACY_SHA256_PATTERN.match(hashed_password or ""))
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash."""
+    if is_legacy_hash(hashed_password):
+        digest = hashlib.sha256(plain_password.encode()).hexdigest()
+        return hmac.compare_digest(digest, hashed_password)
     try:
         return pwd_context.verify(plain_password, hashed_password)
-    except:
-        # Fallback to simple hash comparison for existing passwords
-        return hashlib.sha256(plain_password.encode()).hexdigest() == hashed_password
+    except (ValueError, TypeError):
+        # Malformed or unknown hash format
+        return False
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """Whether a stored hash should be replaced with a current bcrypt hash."""
+    return is_legacy_hash(hashed_password) or pwd_context.needs_update(hashed_password)
 
 def get_password_hash(password: str) -> str:
     """Hash a password."""
-    try:
-        return pwd_context.hash(password)
-    except:
-        # Fallback to simple hash for compatibility
-        return hashlib.sha256(password.encode()).hexdigest()
+    return pwd_context.hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create a JWT access token."""
@@ -51,6 +69,10 @@ def verify_token(token: str) -> Optional[dict]:
         username: str = payload.get("sub")
         if username is None:
             return None
-        return {"username": username, "is_admin": payload.get("is_admin", False)}
+        return {
+            "username": username,
+            "user_id": payload.get("uid"),
+            "is_admin": payload.get("is_admin", False)
+        }
     except JWTError:
         return None
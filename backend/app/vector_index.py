@@ -0,0 +1,349 @@
+"""
+Vector index for "similar books" and chat recommendations.
+
+Each book's title, genre and description is turned into a hashed TF-IDF
+vector (words plus character trigrams, so related word forms such as
+"evolution"/"evolutionary" overlap). The vectors are L2-normalized and kept
+in one contiguous float32 matrix, so a query is a single matrix-vector
+product followed by a partial sort.
+
+A large catalog is partitioned: rebuild() clusters the vectors around
+sqrt(n) centroids and stores each cluster's rows contiguously, and a query
+only scores the VECTOR_INDEX_PROBES clusters closest to it, a few percent
+of the matrix, plus the rows added since. This is approximate; a book in
+an unprobed cluster can be missed. Until the next rebuild, removed books
+leave a zeroed row behind and re-embedded books stay in their old cluster.
+
+Everything runs locally on CPU. The index can be built offline with
+build_vector_index.py and memory-mapped at startup from VECTOR_INDEX_DIR.
+"""
+
+import functools
+import os
+import threading
+import zlib
+import numpy as np
+from .metrics import register_collector
+from .search_index import tokenize
+from .staged_rebuild import StagedRebuild
+
+DIMENSIONS = int(os.getenv("VECTOR_INDEX_DIM", "256"))
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR")
+
+# Catalogs smaller than this are scanned whole, which is exact and fast enough
+PARTITION_MIN_ROWS = int(os.getenv("VECTOR_INDEX_PARTITION_MIN_ROWS", "50000"))
+# Clusters scored per query
+PROBES = int(os.getenv("VECTOR_INDEX_PROBES", "24"))
+
+# k-means for the partitions runs on a sample of this many rows per centroid
+KMEANS_SAMPLE_PER_CENTROID = 40
+KMEANS_ITERATIONS = 8
+
+# Title words say more about a book than a word deep in the description
+FIELD_WEIGHTS = {"title": 2.0, "genre": 1.5, "description": 1.0}
+
+MIN_CAPACITY = 1024
+
+
+# Hashed features of recently seen tokens; vocabularies repeat heavily
+FEATURE_CACHE_SIZE = 200000
+
+
+def _features(token):
+    yield token
+    if len(token) > 3:
+        padded = f"<{token}>"
+        for i in range(len(padded) - 2):
+            yield padded[i:i + 3]
+
+
+@functools.lru_cache(maxsize=FEATURE_CACHE_SIZE)
+def _token_features(token, dimensions):
+    """(buckets, signs) of a token's features in a table of the given size."""
+    hashes = np.fromiter((zlib.crc32(feature.encode()) for feature in _features(token)), dtype=np.uint32)
+    signs = np.where(hashes & 0x80000000, 1.0, -1.0)
+    return (hashes % dimensions).astype(np.intp), signs
+
+
+@register_collector
+def feature_cache_metrics():
+    info = _token_features.cache_info()
+    lookups = info.hits + info.misses
+    return [
+        ("smartlib_vector_feature_cache_hits_total", "counter", "Token feature lookups served from the cache.", info.hits),
+        ("smartlib_vector_feature_cache_misses_total", "counter", "Token features hashed from scratch.", info.misses),
+        ("smartlib_vector_feature_cache_hit_ratio", "gauge", "Share of token feature lookups that hit.", info.hits / lookups if lookups else 0.0),
+    ]
+
+
+class VectorIndex(StagedRebuild):
+    _state = ("_vectors", "_ids", "_centroids", "_offsets", "_size", "_row_of", "_idf")
+
+    def __init__(self, dimensions=DIMENSIONS):
+        self.dimensions = dimensions
+        self._lock = threading.RLock()
+        self._init_rebuild()
+        self._reset()
+        self.ready = False
+
+    def __len__(self):
+        return len(self._row_of)
+
+    def _reset(self):
+        self._vectors = np.zeros((0, self.dimensions), dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._size = 0
+        self._row_of = {}  # book_id -> row in _vectors
+        self._idf = np.ones(self.dimensions, dtype=np.float32)
+        self._centroids = None  # (clusters, dimensions), None when not partitioned
+        self._offsets = None    # first row of each cluster, then the end of the last
+
+    def _hashed_counts(self, fields):
+        """Signed feature-hashed term frequencies for a set of weighted fields."""
+        buckets, weights = [], []
+        for text, weight in fields:
+            for token in tokenize(text):
+                token_buckets, signs = _token_features(token, self.dimensions)
+                buckets.append(token_buckets)
+                weights.append(signs * weight)
+        if not buckets:
+            return np.zeros(self.dimensions, dtype=np.float32)
+        counts = np.bincount(
+            np.concatenate(buckets), weights=np.concatenate(weights), minlength=self.dimensions
+        )
+        return counts.astype(np.float32)
+
+    def _book_counts(self, book):
+        return self._hashed_counts(
+            (getattr(book, field, None), weight) for field, weight in FIELD_WEIGHTS.items()
+        )
+
+    def _to_vector(self, counts):
+        vector = np.sign(counts) * np.log1p(np.abs(counts)) * self._idf
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector.astype(np.float32, copy=False)
+
+    def _to_vectors(self, counts):
+        """_to_vector for a matrix of counts, one book per row."""
+        vectors = np.sign(counts) * np.log1p(np.abs(counts)) * self._idf
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors.astype(np.float32, copy=False)
+
+    def embed(self, text):
+        """Embed free text (e.g. a chat topic) into the index's vector space."""
+        return self._to_vector(self._hashed_counts([(text, 1.0)]))
+
+    def _ensure_capacity(self, rows):
+        capacity = self._vectors.shape[0]
+        if rows <= capacity and self._vectors.flags.writeable:
+            return
+        new_capacity = max(MIN_CAPACITY, capacity * 2, rows)
+        vectors = np.zeros((new_capacity, self.dimensions), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        ids = np.zeros(new_capacity, dtype=np.int64)
+        ids[:self._size] = self._ids[:self._size]
+        self._vectors, self._ids = vectors, ids
+
+    def _partition(self, batch_size=10000):
+        """Cluster the rows with spherical k-means and sort them by cluster."""
+        if self._size < PARTITION_MIN_ROWS:
+            return
+        vectors = self._vectors[:self._size]
+        count = int(np.sqrt(self._size))
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(self._size, min(self._size, count * KMEANS_SAMPLE_PER_CENTROID), replace=False)]
+        centroids = sample[rng.choice(len(sample), count, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            nearest = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, nearest, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # An empty cluster keeps its old centroid
+            centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids).astype(np.float32)
+        clusters = np.empty(self._size, dtype=np.int32)
+        for start in range(0, self._size, batch_size):
+            clusters[start:start + batch_size] = np.argmax(vectors[start:start + batch_size] @ centroids.T, axis=1)
+
+        order = np.argsort(clusters, kind="stable")
+        self._vectors = vectors[order]
+        self._ids = self._ids[:self._size][order]
+        self._row_of = {int(book_id): row for row, book_id in enumerate(self._ids)}
+        self._centroids = centroids
+        self._offsets = np.searchsorted(clusters[order], np.arange(len(centroids) + 1))
+
+    def _add(self, book_id, vector):
+        row = self._row_of.get(book_id)
+        if row is None:
+            self._ensure_capacity(self._size + 1)
+            row = self._size
+            self._size += 1
+            self._row_of[book_id] = row
+            self._ids[row] = book_id
+        else:
+            # A loaded index is a read-only memory map until first copied
+            self._ensure_capacity(self._size)
+        self._vectors[row] = vector
+
+    def add_book(self, book):
+        """Insert or re-embed a single book."""
+        counts = self._book_counts(book)
+        with self._lock:
+            self._add(book.id, self._to_vector(counts))
+            self._log_change((book.id, counts))
+
+    def _remove(self, book_id):
+        row = self._row_of.pop(book_id, None)
+        if row is None:
+            return
+        self._ensure_capacity(self._size)
+        if self._centroids is not None:
+            # Keep the clusters in place; a zero row never scores above 0
+            self._vectors[row] = 0
+            self._ids[row] = -1
+            return
+        # Move the last row into the freed slot
+        last = self._size - 1
+        if row != last:
+            moved_id = int(self._ids[last])
+            self._vectors[row] = self._vectors[last]
+            self._ids[row] = moved_id
+            self._row_of[moved_id] = row
+        self._size = last
+
+    def remove_book(self, book_id):
+        """Remove a book from the index."""
+        with self._lock:
+            self._remove(book_id)
+            self._log_change((book_id, None))
+
+    def _replay(self, change):
+        # Raw counts are logged, so they are weighted with the new IDF
+        book_id, counts = change
+        if counts is None:
+            self._remove(book_id)
+        else:
+            self._add(book_id, self._to_vector(counts))
+
+    def rebuild(self, db, batch_size=1000):
+        """Recompute IDF weights and every vector from the books table.
+
+        Incremental updates reuse the IDF weights from the last rebuild, so
+        this is worth running periodically as the catalog drifts.
+        """
+        from . import models
+
+        def build():
+            staging = VectorIndex(self.dimensions)
+            # One pass: stage the raw counts, then weight them all at once
+            rows = db.query(
+                models.Book.id, models.Book.title, models.Book.genre, models.Book.description
+            ).yield_per(batch_size)
+            for book in rows:
+                staging._add(book.id, staging._book_counts(book))
+
+            counts = staging._vectors[:staging._size]
+            document_frequency = np.count_nonzero(counts, axis=0)
+            staging._idf = np.log((1 + staging._size) / (1 + document_frequency)).astype(np.float32) + 1
+            for start in range(0, staging._size, batch_size):
+                counts[start:start + batch_size] = staging._to_vectors(counts[start:start + batch_size])
+            staging._partition()
+            return staging
+
+        self._staged_rebuild(build)
+
+    def save(self, directory):
+        """Write the index as .npy files that load() can memory-map."""
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            np.save(os.path.join(directory, "vectors.npy"), self._vectors[:self._size])
+            np.save(os.path.join(directory, "ids.npy"), self._ids[:self._size])
+            np.save(os.path.join(directory, "idf.npy"), self._idf)
+            if self._centroids is not None:
+                np.save(os.path.join(directory, "centroids.npy"), self._centroids)
+                np.save(os.path.join(directory, "offsets.npy"), self._offsets)
+
+    def load(self, directory):
+        """Memory-map a saved index; later updates copy it into memory."""
+        with self._lock:
+            vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+            if vectors.shape[1] != self.dimensions:
+                raise ValueError(
+                    f"Saved index has {vectors.shape[1]} dimensions, expected {self.dimensions}"
+                )
+            self._vectors = vectors
+            self._ids = np.load(os.path.join(directory, "ids.npy"))
+            self._idf = np.load(os.path.join(directory, "idf.npy"))
+            self._size = len(self._ids)
+            self._centroids = self._offsets = None
+            if os.path.exists(os.path.join(directory, "centroids.npy")):
+                self._centroids = np.load(os.path.join(directory, "centroids.npy"))
+                self._offsets = np.load(os.path.join(directory, "offsets.npy"))
+            self._row_of = {int(book_id): row for row, book_id in enumerate(self._ids) if book_id >= 0}
+            self.ready = True
+
+    def sync(self, db, batch_size=1000):
+        """Embed books missing from the index and drop ones no longer in the table.
+
+        Brings a loaded index up to date with books added or deleted since
+        it was built offline.
+        """
+        from . import models
+
+        book_ids = {book_id for (book_id,) in db.query(models.Book.id)}
+        with self._lock:
+            indexed = set(self._row_of)
+        removed = indexed - book_ids
+        for book_id in removed:
+            self.remove_book(book_id)
+        missing = sorted(book_ids - indexed)
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            for book in db.query(models.Book).filter(models.Book.id.in_(batch)):
+                self.add_book(book)
+        return {"added": len(missing), "removed": len(removed)}
+
+    def _top(self, query, limit, min_score=0.0):
+        # Take the arrays under the lock and score them outside it, so updates
+        # do not wait on a scan. A row changed by a concurrent update may be
+        # scored either way, and the caller's lookup drops deleted ids.
+        with self._lock:
+            vectors, ids, size, centroids, offsets = (
+                self._vectors, self._ids, self._size, self._centroids, self._offsets
+            )
+        if size == 0 or limit <= 0:
+            return []
+        if centroids is None:
+            ranges = [(0, size)]
+        else:
+            probes = min(PROBES, len(centroids))
+            nearest = np.argpartition(-(centroids @ query), probes - 1)[:probes]
+            # Rows added since the rebuild follow the last cluster
+            ranges = [(offsets[cluster], offsets[cluster + 1]) for cluster in nearest] + [(offsets[-1], size)]
+            ranges = [(start, end) for start, end in ranges if end > start]
+        if not ranges:
+            return []
+        rows = np.concatenate([np.arange(start, end) for start, end in ranges])
+        scores = np.concatenate([vectors[start:end] @ query for start, end in ranges])
+        k = min(limit, len(rows))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [int(ids[rows[i]]) for i in best if scores[i] > min_score and ids[rows[i]] >= 0]
+
+    def similar_to_book(self, book_id, limit=10):
+        """Ids of the books closest to the given one, most similar first."""
+        with self._lock:
+            row = self._row_of.get(book_id)
+            if row is None:
+                return []
+            query = np.array(self._vectors[row])
+        return [other_id for other_id in self._top(query, limit + 1) if other_id != book_id][:limit]
+
+    def search(self, text, limit=10, min_score=0.0):
+        """Ids of the books closest to free text, most similar first."""
+        return self._top(self.embed(text), limit, min_score=min_score)
+
+
+book_vectors = VectorIndex()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Serialization benchmark for SmartLib list endpoints
+Run this script to compare the pydantic response_model path with the
+FAST_JSON_RESPONSES path on large pages. It seeds a throwaway SQLite
+database, so it never touches the configured MySQL server, checks that
+both paths return the same bytes and prints the median time per request.
+
+Needs httpx for FastAPI's TestClient.
+
+Usage: python bench_serialization.py [rows] [repeats]
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Point the app at a scratch database before it is imported
+SCRATCH_DIR = tempfile.mkdtemp(prefix="smartlib-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(SCRATCH_DIR, 'bench.db')}"
+os.environ.pop("DATABASE_REPLICA_URL", None)
+os.environ["SCHEDULER_ENABLED"] = "false"
+
+# Add the app directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+from app import fast_json, main, models, utils
+from app.database import SessionLocal
+
+
+def seed(rows):
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        admin = models.User(username="bench", email="bench@example.com", hashed_password="-", is_admin=True)
+        db.add(admin)
+        db.flush()
+        db.execute(insert(models.Book), [
+            {
+                "title": f"Book {i}",
+                "author": f"Author {i % 500}",
+                "isbn": f"bench-{i}",
+                "description": f"Description of book {i}, with a few words about its plot.",
+                "genre": ["Fiction", "History", "Science"][i % 3],
+                "publication_year": 1900 + i % 120,
+                "available_copies": 2,
+                "total_copies": 3,
+                "created_at": now,
+            }
+            for i in range(rows)
+        ])
+        db.execute(insert(models.BookIssue), [
+            {
+                "user_id": admin.id,
+                "book_id": i + 1,
+                "issue_date": now,
+                "due_date": now + timedelta(days=14),
+                "status": "issued",
+                "created_at": now,
+            }
+            for i in range(rows)
+        ])
+        db.commit()
+        return utils.create_access_token(data={"sub": admin.username, "uid": admin.id, "is_admin": True})
+    finally:
+        db.close()
+
+
+def timed_get(client, url, headers, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        response = client.get(url, headers=headers)
+        timings.append(time.perf_counter() - started)
+        response.raise_for_status()
+    return response, statistics.median(timings)
+
+
+def run_benchmark(rows, repeats):
+    token = seed(rows)
+    auth = {"Authorization": f"Bearer {token}"}
+    identity = {"Accept-Encoding": "identity", **auth}
+    urls = [
+        f"/books?limit={rows}",
+        f"/books/search?query=book&limit={rows}",
+        f"/admin/book-issues?limit={rows}",
+    ]
+
+    with TestClient(main.app) as client:
+        for url in urls:
+            fast_json.FAST_JSON_RESPONSES = False
+            slow, slow_time = timed_get(client, url, identity, repeats)
+            fast_json.FAST_JSON_RESPONSES = True
+            fast, fast_time = timed_get(client, url, identity, repeats)
+            compressed = client.get(url, headers={"Accept-Encoding": "gzip", **auth})
+
+            same = "same bytes" if slow.content == fast.content else "OUTPUT DIFFERS"
+            print(f"{url}")
+            print(f"  pydantic: {slow_time * 1000:8.1f} ms  {len(slow.content)} bytes")
+            print(f"  fast:     {fast_time * 1000:8.1f} ms  ({slow_time / fast_time:.1f}x, {same})")
+            print(f"  gzip:     {compressed.headers.get('content-encoding')} {compressed.num_bytes_downloaded} bytes on the wire")
+
+
+if __name__ == "__main__":
+    print("SmartLib Serialization Benchmark")
+    print("=" * 40)
+
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    run_benchmark(rows, repeats)
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Offline build of the book vector index for SmartLib
+Run this script to embed the whole catalog and save it to VECTOR_INDEX_DIR,
+so the API can memory-map the index at startup instead of building it
+"""
+
+import os
+import sys
+import time
+from dotenv import load_dotenv
+
+# Load environment variables first
+load_dotenv()
+
+# Add the app directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import SessionLocal
+from app.vector_index import VECTOR_INDEX_DIR, book_vectors
+
+def build_vector_index(directory):
+    """Embed every book and write the index to directory"""
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        book_vectors.rebuild(db)
+        book_vectors.save(directory)
+        elapsed = time.perf_counter() - started
+        print(f"[OK] Indexed {len(book_vectors)} books in {elapsed:.1f}s -> {directory}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    print("SmartLib Vector Index Build")
+    print("=" * 40)
+    
+    directory = sys.argv[1] if len(sys.argv) > 1 else VECTOR_INDEX_DIR
+    if not directory:
+        print("Error: pass an output directory or set VECTOR_INDEX_DIR in your .env file")
+        sys.exit(1)
+    
+    try:
+        build_vector_index(directory)
+        print("\n[SUCCESS] Vector index built successfully!")
+    except Exception as e:
+        print(f"\n[ERROR] Vector index build failed: {e}")
+        sys.exit(1)
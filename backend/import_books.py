@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Bulk catalog import for SmartLib
+Run this script to insert or update books from a CSV or JSONL feed, keyed
+on ISBN. A running API server picks the new books up in its search indexes
+on its next restart.
+
+Usage: python import_books.py <file.csv|file.jsonl> [csv|jsonl]
+"""
+
+import os
+import sys
+import time
+from dotenv import load_dotenv
+
+# Load environment variables first
+load_dotenv()
+
+# Add the app directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.catalog_import import detect_format, import_books
+from app.database import Base, SessionLocal, engine
+
+# Only print the first rejected rows; the totals still count all of them
+MAX_PRINTED_ERRORS = 100
+
+def run_import(path, file_format):
+    """Import one feed file and print progress"""
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        printed_errors = 0
+        with open(path, "rb") as feed:
+            for event in import_books(db, feed, file_format, update_indexes=False):
+                elapsed = time.perf_counter() - started
+                if event["event"] == "error":
+                    if printed_errors < MAX_PRINTED_ERRORS:
+                        print(f"[SKIP] Row {event['row']}: {event['error']}")
+                    printed_errors += 1
+                elif event["event"] == "progress":
+                    rate = event["rows"] / elapsed if elapsed else 0
+                    print(f"  {event['rows']} rows ({rate:.0f} rows/s)")
+                else:
+                    print(
+                        f"[OK] {event['rows']} rows in {elapsed:.1f}s: "
+                        f"{event['inserted']} inserted, {event['updated']} updated, {event['failed']} rejected"
+                    )
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    print("SmartLib Catalog Import")
+    print("=" * 40)
+    
+    if len(sys.argv) < 2:
+        print("Usage: python import_books.py <file.csv|file.jsonl> [csv|jsonl]")
+        sys.exit(1)
+    
+    try:
+        path = sys.argv[1]
+        file_format = sys.argv[2] if len(sys.argv) > 2 else detect_format(path)
+        run_import(path, file_format)
+        print("\n[SUCCESS] Catalog import finished!")
+    except Exception as e:
+        print(f"\n[ERROR] Catalog import failed: {e}")
+        sys.exit(1)
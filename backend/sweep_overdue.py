@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Overdue sweep for SmartLib
+Run this script (e.g. from cron) to mark every issued book past its due
+date as overdue. It runs the same batched UPDATE as the API's scheduled
+overdue_sweep job, so it is safe to run alongside the API.
+"""
+
+import os
+import sys
+import time
+from dotenv import load_dotenv
+
+# Load environment variables first
+load_dotenv()
+
+# Add the app directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import crud
+from app.database import SessionLocal
+
+def sweep_overdue(batch_size):
+    """Mark overdue loans and print the open loan counts"""
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        marked = crud.mark_overdue_issues(db, batch_size=batch_size)
+        elapsed = time.perf_counter() - started
+        print(f"[OK] Marked {marked} loans overdue in {elapsed:.2f}s")
+        counts = crud.get_open_issue_counts(db)
+        print(f"[OK] {counts['overdue']} overdue, {counts['issued']} issued and not yet due")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    print("SmartLib Overdue Sweep")
+    print("=" * 40)
+    
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else int(os.getenv("OVERDUE_SWEEP_BATCH_SIZE", "1000"))
+    
+    try:
+        sweep_overdue(batch_size)
+        print("\n[SUCCESS] Overdue sweep finished!")
+    except Exception as e:
+        print(f"\n[ERROR] Overdue sweep failed: {e}")
+        sys.exit(1)
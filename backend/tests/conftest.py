@@ -0,0 +1,64 @@
+"""
+Test setup: the app runs against a throwaway SQLite database.
+
+The environment is set before app is imported, since the engines and
+settings are read at import time.
+"""
+
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+_db_dir = tempfile.mkdtemp(prefix="smartlib-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'library.db')}"
+os.environ["SCHEDULER_ENABLED"] = "false"
+# Keep the chat endpoints on the local fallback
+os.environ["HUGGINGFACEHUB_API_TOKEN"] = ""
+
+import pytest
+from fastapi.testclient import TestClient
+from app import main, models, utils
+from app.database import SessionLocal
+
+
+def _login(client, username, password):
+    response = client.post("/auth/login", json={"username": username, "password": password})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="session")
+def client():
+    db = SessionLocal()
+    db.add(models.User(username="admin", email="admin@example.com", hashed_password=utils.get_password_hash("admin123"), is_admin=True))
+    db.add(models.User(username="reader", email="reader@example.com", hashed_password=utils.get_password_hash("reader123")))
+    db.commit()
+    db.close()
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture(scope="session")
+def admin_headers(client):
+    return _login(client, "admin", "admin123")
+
+
+@pytest.fixture(scope="session")
+def reader_headers(client):
+    return _login(client, "reader", "reader123")
+
+
+@pytest.fixture
+def make_book(client, admin_headers):
+    """Create a book through the API and return its JSON."""
+    def make_book(copies=1, **fields):
+        book = {"title": "A Book", "author": "An Author", "available_copies": copies, "total_copies": copies, **fields}
+        response = client.post("/admin/books", json=book, headers=admin_headers)
+        assert response.status_code == 200, response.text
+        return response.json()
+    return make_book
+
+
+@pytest.fixture
+def due_date():
+    return {"due_date": (datetime.utcnow() + timedelta(days=14)).isoformat()}
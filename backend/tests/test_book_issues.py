@@ -0,0 +1,37 @@
+"""Copy counts change through conditional UPDATEs, so they never go negative."""
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _available(client, book_id):
+    return client.get(f"/books/{book_id}").json()["available_copies"]
+
+
+def test_last_copy_is_issued_once(client, make_book, reader_headers, due_date):
+    book = make_book(copies=1)
+    first = client.post(f"/books/{book['id']}/issue", json=due_date, headers=reader_headers)
+    second = client.post(f"/books/{book['id']}/issue", json=due_date, headers=reader_headers)
+    assert first.status_code == 200
+    assert second.status_code == 400
+    assert _available(client, book["id"]) == 0
+
+
+def test_concurrent_issues_never_oversell(client, make_book, reader_headers, due_date):
+    book = make_book(copies=3)
+
+    def issue(_):
+        return client.post(f"/books/{book['id']}/issue", json=due_date, headers=reader_headers).status_code
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        statuses = list(pool.map(issue, range(8)))
+    assert statuses.count(200) == 3
+    assert statuses.count(400) == 5
+    assert _available(client, book["id"]) == 0
+
+
+def test_return_releases_the_copy_once(client, make_book, reader_headers, due_date):
+    book = make_book(copies=1)
+    issue = client.post(f"/books/{book['id']}/issue", json=due_date, headers=reader_headers).json()
+    assert client.post(f"/books/return/{issue['id']}", headers=reader_headers).status_code == 200
+    client.post(f"/books/return/{issue['id']}", headers=reader_headers)
+    assert _available(client, book["id"]) == 1
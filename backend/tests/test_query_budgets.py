@@ -0,0 +1,29 @@
+"""Endpoints that list loans must not run a query per row (N+1)."""
+
+from app.sql_profiler import SQL_N_PLUS_ONE_THRESHOLD, assert_max_queries
+
+# More loans than any budget below, so a per-row query cannot fit
+LOANS = SQL_N_PLUS_ONE_THRESHOLD + 5
+
+
+def _issue_loans(client, make_book, headers, due_date):
+    for number in range(LOANS):
+        book = make_book(title=f"Budget Book {number}")
+        response = client.post(f"/books/{book['id']}/issue", json=due_date, headers=headers)
+        assert response.status_code == 200, response.text
+
+
+def test_admin_book_issues_query_budget(client, make_book, admin_headers, reader_headers, due_date):
+    _issue_loans(client, make_book, reader_headers, due_date)
+    with assert_max_queries(2):
+        response = client.get(f"/admin/book-issues?limit={LOANS}", headers=admin_headers)
+    assert response.status_code == 200
+    assert len(response.json()) == LOANS
+
+
+def test_my_books_query_budget(client, make_book, admin_headers, due_date):
+    _issue_loans(client, make_book, admin_headers, due_date)
+    with assert_max_queries(2):
+        response = client.get("/my-books", headers=admin_headers)
+    assert response.status_code == 200
+    assert len(response.json()) >= LOANS
@@ -0,0 +1,38 @@
+"""Catalog reads go to the primary while the replica may lag behind a change."""
+
+import shutil
+from sqlalchemy.orm import sessionmaker
+from app import http_cache, main
+from app.database import engine, make_engine
+
+
+def test_catalog_reads_see_a_fresh_edit(client, make_book, admin_headers, monkeypatch, tmp_path):
+    book = make_book(title="Before")
+
+    # A replica that stopped replicating right after the book was created
+    replica_path = tmp_path / "replica.db"
+    shutil.copy(engine.url.database, replica_path)
+    replica = make_engine(f"sqlite:///{replica_path}")
+    ReplicaSession = sessionmaker(bind=replica)
+
+    def get_replica_db():
+        db = ReplicaSession()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    monkeypatch.setattr(main, "get_read_db", get_replica_db)
+    monkeypatch.setattr(http_cache, "read_engine", replica)
+
+    response = client.put(f"/admin/books/{book['id']}", json={"title": "After"}, headers=admin_headers)
+    assert response.status_code == 200
+
+    # Inside the read-your-writes window the primary answers
+    assert client.get(f"/books/{book['id']}").json()["title"] == "After"
+    assert client.get("/books/search", params={"query": "After"}).json()[0]["id"] == book["id"]
+
+    # Once it has passed, reads go back to the (stale) replica
+    monkeypatch.setattr(http_cache, "READ_YOUR_WRITES_SECONDS", 0)
+    assert client.get(f"/books/{book['id']}").json()["title"] == "Before"
+    replica.dispose()
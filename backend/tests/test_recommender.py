@@ -0,0 +1,22 @@
+from app.recommender import CoBorrowModel
+
+
+def test_reborrowing_an_evicted_book_counts_once():
+    model = CoBorrowModel(max_user_history=2)
+    model.record_issue(1, 10)
+    model.record_issue(1, 20)
+    model.record_issue(1, 30)  # evicts 10 from the pairing window
+    model.record_issue(1, 10)
+    assert model._borrowers[10] == 1
+    assert model._cooccurrence[10] == {20: 1, 30: 1}
+
+
+def test_co_borrowed_books_rank_first():
+    model = CoBorrowModel()
+    for user_id in (1, 2, 3):
+        model.record_issue(user_id, 10)
+        model.record_issue(user_id, 20)
+    model.record_issue(4, 10)
+    model.record_issue(4, 30)
+    assert model.also_borrowed(10) == [20, 30]
+    assert model.recommend_for_user(4) == [20]
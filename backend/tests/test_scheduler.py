@@ -0,0 +1,8 @@
+def test_disabled_job_runs_on_demand(client, admin_headers):
+    jobs = {job["name"]: job for job in client.get("/admin/jobs", headers=admin_headers).json()}
+    assert jobs["index_rebuild"]["enabled"] is False
+
+    response = client.post("/admin/jobs/index_rebuild/run", headers=admin_headers)
+    assert response.status_code == 200
+    assert response.json()["runs"] == 1
+    assert response.json()["last_error"] is None
@@ -0,0 +1,48 @@
+"""Updates made while an index rebuilds survive the swap."""
+
+from types import SimpleNamespace
+from app.recommender import CoBorrowModel
+from app.search_index import SearchIndex
+
+
+def _book(book_id, title):
+    return SimpleNamespace(id=book_id, title=title, author="Someone", genre="Fiction", description=None)
+
+
+def test_search_index_replays_updates_made_during_a_rebuild():
+    index = SearchIndex()
+    index.add_book(_book(1, "old title"))
+
+    def build():
+        staging = SearchIndex()
+        staging.add_book(_book(1, "old title"))
+        staging.add_book(_book(2, "removed later"))
+        # The live index changes while the table is being scanned
+        index.add_book(_book(1, "new title"))
+        index.add_book(_book(3, "added meanwhile"))
+        index.remove_book(2)
+        return staging
+
+    index._staged_rebuild(build)
+    assert index.search("new") == [1]
+    assert index.search("old") == []
+    assert index.search("meanwhile") == [3]
+    assert index.search("removed") == []
+    assert index._changes is None
+
+
+def test_co_borrow_replay_skips_issues_the_scan_saw():
+    model = CoBorrowModel()
+
+    def build():
+        staging = CoBorrowModel()
+        staging._record(1, 10)
+        staging._record(1, 20)
+        # Recorded live and also committed before the scan reached it
+        model.record_issue(1, 20)
+        model.record_issue(1, 30)
+        return staging
+
+    model._staged_rebuild(build)
+    assert model._borrowers == {10: 1, 20: 1, 30: 1}
+    assert sorted(model.also_borrowed(30)) == [10, 20]
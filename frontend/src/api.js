@@ -46,7 +46,9 @@ export const authAPI = {
 
 // Books API
 export const booksAPI = {
-  getBooks: (skip = 0, limit = 100) => api.get(`/books?skip=${skip}&limit=${limit}`),
+  // filters: available_only, genre, author (name prefix), year
+  getBooks: (skip = 0, limit = 100, filters = {}) =>
+    api.get('/books', { params: { skip, limit, ...filters } }),
   getBook: (id) => api.get(`/books/${id}`),
   searchBooks: (query, genre = null) => {
     const params = new URLSearchParams({ query });
@@ -58,9 +60,58 @@ export const booksAPI = {
   deleteBook: (id) => api.delete(`/admin/books/${id}`),
 };
 
+// Parse one Server-Sent Event block into its type and JSON payload
+const parseEvent = (rawEvent) => {
+  let type = 'message';
+  let data = '';
+  for (const line of rawEvent.split('\n')) {
+    if (line.startsWith('event: ')) type = line.slice(7);
+    else if (line.startsWith('data: ')) data += line.slice(6);
+  }
+  return { type, payload: data ? JSON.parse(data) : null };
+};
+
 // Chat API
 export const chatAPI = {
   sendMessage: (message) => api.post('/chat', { message }),
+  // Newest first; pass the X-Next-Cursor header of a page to get older ones
+  getHistory: (cursor = null, archived = false) =>
+    api.get('/chat/history', { params: { ...(cursor && { cursor }), archived } }),
+  // Streams the reply, calling onToken for each chunk as it arrives.
+  // Resolves with the id of the saved chat message.
+  streamMessage: async (message, onToken) => {
+    const token = localStorage.getItem('token');
+    const response = await fetch(`${API_BASE_URL}/chat/stream`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        ...(token && { Authorization: `Bearer ${token}` }),
+      },
+      body: JSON.stringify({ message }),
+    });
+    if (!response.ok) {
+      throw new Error(`Chat stream failed with status ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let messageId = null;
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const rawEvents = buffer.split('\n\n');
+      buffer = rawEvents.pop();
+      for (const rawEvent of rawEvents) {
+        const { type, payload } = parseEvent(rawEvent);
+        if (type === 'done') messageId = payload.message_id;
+        else if (type === 'error') throw new Error(payload.detail);
+        else if (payload) onToken(payload.token);
+      }
+    }
+    return messageId;
+  },
 };
 
 // Book Issue API
@@ -68,7 +119,9 @@ export const bookIssueAPI = {
   issueBook: (bookId, issueData) => api.post(`/books/${bookId}/issue`, issueData),
   returnBook: (issueId) => api.post(`/books/return/${issueId}`),
   getMyBooks: () => api.get('/my-books'),
-  getAllBookIssues: (skip = 0, limit = 100) => api.get(`/admin/book-issues?skip=${skip}&limit=${limit}`),
+  // filters: status, user_id, book_id, due_after, due_before, sort, order
+  getAllBookIssues: (skip = 0, limit = 100, filters = {}) =>
+    api.get('/admin/book-issues', { params: { skip, limit, ...filters } }),
 };
 
 export default api;
@@ -31,16 +31,21 @@ const Chatbot = () => {
     setInputMessage('');
     setLoading(true);
 
+    const aiMessageId = `ai-${userMessage.id}`;
+    let started = false;
+    const appendToken = (token) => {
+      if (!started) {
+        started = true;
+        setMessages(prev => [...prev, { id: aiMessageId, type: 'ai', content: token, timestamp: new Date() }]);
+        return;
+      }
+      setMessages(prev => prev.map(message => (
+        message.id === aiMessageId ? { ...message, content: message.content + token } : message
+      )));
+    };
+
     try {
-      const response = await chatAPI.sendMessage(inputMessage);
-      const aiMessage = {
-        id: response.data.message_id,
-        type: 'ai',
-        content: response.data.response,
-        timestamp: new Date()
-      };
-      
-      setMessages(prev => [...prev, aiMessage]);
+      await chatAPI.streamMessage(inputMessage, appendToken);
     } catch (error) {
       toast.error('Failed to send message. Please try again.');
       console.error('Chat error:', error);
@@ -116,7 +121,7 @@ const Chatbot = () => {
           ))
         )}
         
-        {loading && (
+        {loading && messages[messages.length - 1]?.type !== 'ai' && (
           <div style={{ textAlign: 'center', color: '#666', fontStyle: 'italic' }}>
             AI is thinking...
           </div>
@@ -28,8 +28,8 @@ const MyBooksPage = () => {
 
   const fetchAvailableBooks = async () => {
     try {
-      const response = await booksAPI.getBooks();
-      setAvailableBooks(response.data.filter(book => book.available_copies > 0));
+      const response = await booksAPI.getBooks(0, 100, { available_only: true });
+      setAvailableBooks(response.data);
       setLoading(false);
     } catch (error) {
       console.error('Failed to fetch available books:', error);